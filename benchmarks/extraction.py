@@ -0,0 +1,76 @@
+import glob
+import sys
+import time
+
+from benchmarks import pages
+from scraping import extraction
+
+# fields that legitimately differ between backends
+IGNORED_PATHS = [
+    ('crawler',),
+    ('mobile', 'web', 'description', 'html'),  # serializers differ in void tags and quoting
+]
+
+
+def load_fixtures(directory):
+    htmls = []
+    for filename in sorted(glob.glob(directory + '/*.html')):
+        with open(filename) as file:
+            htmls.append((filename, file.read()))
+    return htmls
+
+
+def check_parity(htmls, reference='bs4'):
+    mismatches = []
+    for filename, html in htmls:
+        expected = _strip(extraction.get_extractor(html, reference).get_data())
+        for backend in extraction.BACKENDS:
+            actual = _strip(extraction.get_extractor(html, backend).get_data())
+            if actual != expected:
+                mismatches.append((filename, backend))
+    return mismatches
+
+
+def benchmark(htmls, repeat=3):
+    ads_per_second = {}
+    for backend in extraction.BACKENDS:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for _, html in htmls:
+                extraction.get_extractor(html, backend).get_data()
+        duration = time.perf_counter() - start
+        ads_per_second[backend] = len(htmls) * repeat / duration
+    return ads_per_second
+
+
+def _strip(car):
+    if car is None:
+        return None
+    for path in IGNORED_PATHS:
+        parent = car
+        for key in path[:-1]:
+            parent = parent.get(key) or {}
+        parent.pop(path[-1], None)
+    return car
+
+
+def main():
+    directory = sys.argv[1] if len(sys.argv) > 1 else pages.FIXTURES_DIRECTORY
+    htmls = load_fixtures(directory)
+    if len(htmls) == 0:
+        print('no fixtures in %s' % directory)
+        sys.exit(1)
+
+    mismatches = check_parity(htmls)
+    for filename, backend in mismatches:
+        print('parity mismatch: %s (%s)' % (filename, backend))
+
+    for backend, rate in benchmark(htmls).items():
+        print('%-6s %8.1f ads/sec' % (backend, rate))
+
+    if len(mismatches) > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
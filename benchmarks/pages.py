@@ -0,0 +1,157 @@
+import glob
+import html
+import json
+import os
+import sys
+
+from benchmarks import synthetic
+
+# ads per results page, like suchen.mobile.de
+RESULTS_PER_PAGE = 20
+
+FIXTURES_DIRECTORY = os.path.dirname(os.path.abspath(__file__)) + '/fixtures/ads'
+
+# shipped fixture pages, regenerated with python -m benchmarks.pages
+FIXTURES = 12
+
+# more shipped pages with the indentation, nested tags and comments of real pages
+FORMATTED_FIXTURES = 4
+
+TECHNICAL_LABELS = {
+    'mileage': 'Kilometerstand',
+    'firstRegistration': 'Erstzulassung',
+    'power': 'Leistung',
+    'cubicCapacity': 'Hubraum',
+    'emissionClass': 'Schadstoffklasse',
+    'transmission': 'Getriebe',
+    'hu': 'HU',
+    'numberOfPreviousOwners': 'Anzahl der Fahrzeughalter',
+    'interior': 'Innenausstattung',
+    'climatisation': 'Klimatisierung',
+}
+
+
+def render_ad_page(car):
+    # ad page in the markup the extractors parse, built from a synthetic car
+    mobile = car['mobile']
+    web = mobile['web']
+    parts = [
+        '<html><head><title>%d</title></head><body>' % mobile['ad_id'],
+        '<h1 id="rbt-ad-title">%s</h1>' % html.escape(mobile['dart']['adSpecificsFuel'].title() + ' car'),
+        '<span class="rbt-prime-price">%s €</span>' % '{:,}'.format(int(mobile['dart']['ad']['price'])).replace(',', '.'),
+        '<div class="parking-block" data-parking="%d"></div>' % mobile['ad_id'],
+        '<p id="rbt-seller-address">Musterstraße 1<br/>12345 Berlin</p>',
+        '<span id="rbt-seller-phone">Tel.: +49 30 1234567</span>',
+        '<div id="rbt-td-box">',
+    ]
+    for key, value in web['technical'].items():
+        parts.append('<div class="g-row"><div id="rbt-%s-l">%s</div><div id="rbt-%s-v">%s</div></div>' % (
+            key, TECHNICAL_LABELS.get(key, key), key, html.escape(value)))
+    parts.append('</div>')
+
+    if web['features'] is not None:
+        parts.append('<div id="rbt-features"><div class="g-row">')
+        parts.extend('<div>%s</div>' % html.escape(feature) for feature in web['features'])
+        parts.append('</div></div>')
+
+    if web['description'] is not None:
+        parts.append('<div class="cBox-body--vehicledescription"><div class="description">%s</div></div>' % html.escape(web['description']['text']))
+
+    parts.append('<script>mobile.dart.setAdData(%s);\n</script>' % json.dumps(mobile['dart']))
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+def render_formatted_ad_page(car):
+    # like render_ad_page, but laid out like a real page: whitespace between tags, nested tags and comments
+    # technical rows stay on one line, the reference extractor expects elements only there
+    mobile = car['mobile']
+    web = mobile['web']
+    lines = [
+        '<!DOCTYPE html>',
+        '<html lang="de">',
+        '  <head>',
+        '    <meta charset="utf-8">',
+        '    <title>%d</title>' % mobile['ad_id'],
+        '  </head>',
+        '  <body>',
+        '    <!-- header -->',
+        '    <div class="cBox cBox--content">',
+        '      <h1 id="rbt-ad-title">%s</h1>' % html.escape(mobile['dart']['adSpecificsFuel'].title() + ' car'),
+        '      <div class="price-block">',
+        '        <span class="h3 rbt-prime-price">%s €</span>' % '{:,}'.format(int(mobile['dart']['ad']['price'])).replace(',', '.'),
+        '      </div>',
+        '      <div class="parking-block u-pull-right" data-parking="%d">' % mobile['ad_id'],
+        '      </div>',
+        '    </div>',
+        '    <div class="cBox cBox--content">',
+        '      <p id="rbt-seller-address">',
+        '        Musterstraße 1<br>',
+        '        12345 <b>Berlin</b>',
+        '      </p>',
+        '      <span id="rbt-seller-phone">Tel.: +49 30 1234567</span>',
+        '    </div>',
+        '    <div id="rbt-td-box" class="cBox-body cBox-body--technical-data">',
+    ]
+    for key, value in web['technical'].items():
+        lines.append('      <div class="g-row u-margin-bottom-9"><div id="rbt-%s-l" class="g-col-6">%s</div><div id="rbt-%s-v" class="g-col-6">%s</div></div>' % (
+            key, TECHNICAL_LABELS.get(key, key), key, html.escape(value)))
+    lines.append('    </div>')
+
+    if web['features'] is not None:
+        lines.append('    <div id="rbt-features" class="cBox-body cBox-body--features">')
+        lines.append('      <div class="g-row">')
+        for feature in web['features']:
+            lines.append('        <div class="bullet-list"><p>%s</p></div>' % html.escape(feature))
+        lines.append('        <!-- more features -->')
+        lines.append('      </div>')
+        lines.append('    </div>')
+
+    if web['description'] is not None:
+        paragraphs = web['description']['text'].split('. ')
+        lines.append('    <div class="cBox-body cBox-body--vehicledescription">')
+        lines.append('      <div class="description">')
+        lines.append('        <b>Fahrzeugbeschreibung</b><br>')
+        for paragraph in paragraphs:
+            lines.append('        %s<br>' % html.escape(paragraph))
+        lines.append('      </div>')
+        lines.append('    </div>')
+
+    lines.append('    <script>mobile.dart.setAdData(%s);\n</script>' % json.dumps(mobile['dart']))
+    lines.append('  </body>')
+    lines.append('</html>')
+    return '\n'.join(lines) + '\n'
+
+
+def render_results_page(ad_ids):
+    items = ['<div class="cBox-body--resultitem"><a data-ad-id="%d" href="#">%d</a></div>' % (ad_id, ad_id) for ad_id in ad_ids]
+    return '<html><body>%s</body></html>' % ''.join(items)
+
+
+def load_recorded_ads(directory):
+    # recorded ad pages named <ad id>.html, ad id -> html
+    pages = {}
+    for filename in sorted(glob.glob(directory + '/*.html')):
+        ad_id = os.path.splitext(os.path.basename(filename))[0]
+        if ad_id.isdigit():
+            with open(filename) as file:
+                pages[int(ad_id)] = file.read()
+    return pages
+
+
+def write_fixtures(directory=FIXTURES_DIRECTORY, n=FIXTURES, formatted=FORMATTED_FIXTURES):
+    os.makedirs(directory, exist_ok=True)
+    cars = synthetic.generate_cars(n + formatted, seed=0)
+    for position, car in enumerate(cars):
+        page = render_ad_page(car) if position < n else render_formatted_ad_page(car)
+        with open('%s/%d.html' % (directory, car['mobile']['ad_id']), 'w') as file:
+            file.write(page)
+
+
+def main():
+    directory = sys.argv[1] if len(sys.argv) > 1 else FIXTURES_DIRECTORY
+    write_fixtures(directory)
+
+
+if __name__ == '__main__':
+    main()
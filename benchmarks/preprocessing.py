@@ -0,0 +1,38 @@
+import sys
+import time
+
+import prediction
+from benchmarks import synthetic
+
+SIZES = [10000, 100000, 1000000]
+
+
+def benchmark(n):
+    cars = synthetic.generate_cars(n)
+
+    start = time.perf_counter()
+    flat = prediction.flatten(cars)
+    flatten_duration = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prediction.preprocess(flat)
+    preprocess_duration = time.perf_counter() - start
+
+    return {
+        'cars': n,
+        'flatten_rows_per_second': n / flatten_duration,
+        'preprocess_rows_per_second': n / preprocess_duration,
+        'total_rows_per_second': n / (flatten_duration + preprocess_duration),
+    }
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or SIZES
+    for n in sizes:
+        result = benchmark(n)
+        print('%8d cars: flatten %10.0f rows/sec, preprocess %10.0f rows/sec, total %10.0f rows/sec' % (
+            n, result['flatten_rows_per_second'], result['preprocess_rows_per_second'], result['total_rows_per_second']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks import pages as ad_pages
+
+
+class FakeMobileServer(object):
+    # local stand-in for suchen.mobile.de serving results and ad pages, newest ads first
+    pages = None
+    latency = None
+    error_rate = None
+
+    def __init__(self, pages, latency=0.0, error_rate=0.0, seed=0):
+        self.pages = pages  # ad id -> html
+        self.latency = latency
+        self.error_rate = error_rate
+        self._ad_ids = sorted(pages, reverse=True)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self._server.server_address[1]
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._create_handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='fake-mobile', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def respond(self, path):
+        # status code and body for a request path
+        with self._lock:
+            self.requests += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if failed:
+            return 503, None
+
+        parts = urllib.parse.urlsplit(path)
+        query = urllib.parse.parse_qs(parts.query)
+        if parts.path == '/fahrzeuge/search.html':
+            page = int(query.get('pageNumber', ['1'])[0])
+            start = (page - 1) * ad_pages.RESULTS_PER_PAGE
+            return 200, ad_pages.render_results_page(self._ad_ids[start:start + ad_pages.RESULTS_PER_PAGE])
+        if parts.path == '/fahrzeuge/details.html':
+            html = self.pages.get(int(query.get('id', ['0'])[0]))
+            if html is not None:
+                return 200, html
+        return 404, None
+
+    def _create_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self._send(include_body=True)
+
+            def do_HEAD(self):
+                self._send(include_body=False)
+
+            def _send(self, include_body):
+                status_code, html = server.respond(self.path)
+                body = html.encode('utf-8') if html is not None else b''
+                self.send_response(status_code)
+                if status_code == 503:
+                    self.send_header('Retry-After', '0')
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if include_body:
+                    self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
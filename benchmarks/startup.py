@@ -0,0 +1,86 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# entry point -> import budget in seconds, measured with python -X importtime
+BUDGETS = {
+    'main.py': 0.5,
+    'prediction.py': 3.0,
+}
+
+# modules that must not be imported at startup, they are loaded by the code paths that use them
+DEFERRED_MODULES = ['boto3', 'graphviz', 'sklearn.feature_extraction.text', 'sklearn.feature_selection', 'sklearn.ensemble']
+
+# slowest imports listed per entry point
+TOP = 10
+
+
+def measure(entry_point):
+    # runs the module body of the entry point without calling main()
+    code = 'import runpy, sys; sys.path.insert(0, %r); runpy.run_path(%r, run_name="startup")' % (ROOT, os.path.join(ROOT, entry_point))
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, capture_output=True, text=True)
+    wall_seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError('importing %s failed:\n%s' % (entry_point, process.stderr))
+
+    imports = parse_importtime(process.stderr)
+    return {
+        'entry_point': entry_point,
+        'wall_seconds': wall_seconds,
+        'import_seconds': sum(cumulative for name, cumulative, level in imports if level == 0),
+        'imports': imports,
+    }
+
+
+def parse_importtime(output):
+    # (module, cumulative seconds, nesting level) per line of python -X importtime
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip())) // 2 - 1
+        imports.append((name.strip(), int(cumulative) / 1000000, level))
+    return imports
+
+
+def check(result, budget):
+    # list of problems, empty if the entry point starts within budget
+    problems = []
+    if result['import_seconds'] > budget:
+        problems.append('%s imports take %.2fs, budget is %.2fs' % (result['entry_point'], result['import_seconds'], budget))
+    imported = set(name for name, _, _ in result['imports'])
+    for module in DEFERRED_MODULES:
+        if module in imported:
+            problems.append('%s imports %s at startup' % (result['entry_point'], module))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='import time of the entry points against their budgets')
+    parser.add_argument('entry_points', nargs='*', default=sorted(BUDGETS))
+    parser.add_argument('--top', type=int, default=TOP, help='slowest top level imports to list')
+    args = parser.parse_args()
+
+    problems = []
+    for entry_point in args.entry_points:
+        result = measure(entry_point)
+        print('%-16s imports %6.2fs  wall %6.2fs  budget %6.2fs' % (entry_point, result['import_seconds'], result['wall_seconds'], BUDGETS[entry_point]))
+        slowest = sorted((imported for imported in result['imports'] if imported[2] <= 1), key=lambda imported: -imported[1])
+        for name, cumulative, level in slowest[:args.top]:
+            print('  %s%-40s %6.3fs' % ('  ' * level, name, cumulative))
+        problems.extend(check(result, BUDGETS[entry_point]))
+
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    if len(problems) > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import instrumentation
+import scraping
+import storage
+from benchmarks import extraction as extraction_benchmark
+from benchmarks import pages as ad_pages
+from benchmarks import preprocessing as preprocessing_benchmark
+from benchmarks import synthetic
+from benchmarks.server import FakeMobileServer
+from prediction import predictor
+from prediction import text
+from storage import backends
+
+REPORT_FORMAT_VERSION = 1
+
+# relative change of a timing metric that counts as a regression
+TOLERANCE = 0.2
+
+S3_BUCKET_NAME = 'benchmark-ads'
+
+
+def create_storage_backend(kind, directory):
+    # local stand-ins, s3 needs moto to fake the bucket in this process
+    if kind == 'local':
+        return backends.LocalBackend(directory + '/ads')
+    if kind == 'segments':
+        return backends.SegmentBackend(directory + '/segments')
+    if kind == 's3':
+        import boto3
+        import moto
+
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        moto.mock_aws().start()
+        boto3.client('s3').create_bucket(Bucket=S3_BUCKET_NAME)
+        return backends.S3Backend(S3_BUCKET_NAME, directory + '/storage_index.sqlite')
+    raise ValueError('unknown storage stand-in: %s' % kind)
+
+
+def benchmark_scrape_search(cars, directory, storage_kind='local', latency=0.0, error_rate=0.0, requests_per_second=1000):
+    # end to end against the fake server: a cold pass scrapes every ad, a warm pass loads them from storage
+    server = FakeMobileServer({car['mobile']['ad_id']: ad_pages.render_ad_page(car) for car in cars},
+                              latency=latency, error_rate=error_rate).start()
+    scraping.BASE_URL = server.url
+    scraping.rate_limiter.requests_per_second = requests_per_second
+    storage.METADATA_PATH = directory + '/ad_metadata.sqlite'
+    storage.HISTORY_PATH = directory + '/price_history.sqlite'
+    storage.set_backend(create_storage_backend(storage_kind, directory))
+
+    pages = -(-len(cars) // ad_pages.RESULTS_PER_PAGE)
+    results = {}
+    try:
+        for name in ['cold', 'warm']:
+            instrumentation.reset()
+            requests_before = server.requests
+            start = time.perf_counter()
+            scraped = scraping.scrape_search(scraping.USED_CARS, pages=pages, ad_ids=scraping.create_seen_cache())
+            duration = time.perf_counter() - start
+            results[name] = {
+                'ads': len(scraped),
+                'seconds': duration,
+                'ads_per_second': len(scraped) / duration,
+                'requests': server.requests - requests_before,
+                'metrics': instrumentation.snapshot(),
+            }
+    finally:
+        server.stop()
+
+    results['errors'] = server.errors
+    return results
+
+
+def benchmark_extraction(htmls):
+    return {
+        'ads': len(htmls),
+        'parity_mismatches': len(extraction_benchmark.check_parity(htmls)),
+        'ads_per_second': extraction_benchmark.benchmark(htmls, repeat=1),
+    }
+
+
+def benchmark_train_and_predict(cars, test_cars, backend):
+    trained = predictor.Predictor(backend=backend)
+    start = time.perf_counter()
+    trained.train(cars, cross_validate=False)
+    train_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    trained.predict(test_cars)
+    predict_seconds = time.perf_counter() - start
+
+    # second run finds the description vectors in the text cache
+    start = time.perf_counter()
+    trained.predict(test_cars)
+    cached_predict_seconds = time.perf_counter() - start
+
+    return {
+        'cars': len(cars),
+        'train_seconds': train_seconds,
+        'predict_cars_per_second': len(test_cars) / predict_seconds,
+        'cached_predict_cars_per_second': len(test_cars) / cached_predict_seconds,
+    }
+
+
+def run(args):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        scrape_cars = synthetic.generate_cars(args.scrape_ads, seed=1)
+        results['scrape_search'] = benchmark_scrape_search(scrape_cars, directory, storage_kind=args.storage,
+                                                           latency=args.latency, error_rate=args.error_rate)
+        results['extraction'] = benchmark_extraction([(car['mobile']['ad_id'], ad_pages.render_ad_page(car)) for car in scrape_cars])
+        if args.recorded is not None:
+            results['extraction_recorded'] = benchmark_extraction(sorted(ad_pages.load_recorded_ads(args.recorded).items()))
+
+        results['preprocess'] = preprocessing_benchmark.benchmark(args.cars)
+
+        cars = synthetic.generate_cars(args.cars, seed=2)
+        test_cars = synthetic.generate_cars(max(1, args.cars // 10), seed=3, first_ad_id=300000000)
+        for backend in args.backends:
+            text.set_cache(text.TextCache('%s/text_features_%s.sqlite' % (directory, backend)))  # every backend starts cold
+            results['train_predict_' + backend] = benchmark_train_and_predict(cars, test_cars, backend)
+
+    return {
+        'version': REPORT_FORMAT_VERSION,
+        'created_at': str(datetime.now()),
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'parameters': vars(args),
+        'results': results,
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=''):
+    # nested results as {'scrape_search.cold.seconds': ...}, numbers only
+    values = {}
+    for key, value in results.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            values.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def compare(report, baseline, tolerance=TOLERANCE):
+    # (metric, baseline, current, change) for rates that dropped or durations that grew beyond tolerance
+    current_values = flatten(report['results'])
+    baseline_values = flatten(baseline['results'])
+    regressions = []
+    for name, current in sorted(current_values.items()):
+        previous = baseline_values.get(name)
+        if previous is None or '.metrics.' in name:
+            continue
+        if name.endswith('parity_mismatches'):
+            if current > previous:
+                regressions.append((name, previous, current, float(current - previous)))
+            continue
+        if previous == 0:
+            continue
+        change = (current - previous) / previous
+        if name.endswith('per_second') and change < -tolerance:
+            regressions.append((name, previous, current, change))
+        elif name.endswith('seconds') and not name.endswith('per_second') and change > tolerance:
+            regressions.append((name, previous, current, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='offline benchmarks of scraping, extraction and prediction')
+    parser.add_argument('--cars', type=int, default=10000, help='synthetic cars for preprocess, train and predict')
+    parser.add_argument('--scrape-ads', type=int, default=200, help='ads served by the fake mobile.de server')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the fake server waits per request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with 503')
+    parser.add_argument('--recorded', default=None, help='directory of recorded ad pages named <ad id>.html')
+    parser.add_argument('--storage', default='local', choices=['local', 'segments', 's3'], help='storage stand-in')
+    parser.add_argument('--backends', nargs='+', default=[predictor.DEFAULT_BACKEND], choices=predictor.BACKENDS)
+    parser.add_argument('--output', default=None, help='JSON report, stdout by default')
+    parser.add_argument('--compare', default=None, help='earlier JSON report to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, tolerance=args.tolerance)
+        for name, previous, current, change in regressions:
+            print('regression: %s %.4g -> %.4g (%+.0f%%)' % (name, previous, current, change * 100), file=sys.stderr)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import random
+from datetime import datetime, timedelta
+
+FEATURES = ['feature %d' % i for i in range(150)]
+
+FUELS = ['PETROL', 'DIESEL', 'LPG', 'HYBRID', 'ELECTRICITY']
+
+INTERIORS = ['Vollleder, Schwarz', 'Teilleder, Grau', 'Stoff, Beige', 'Alcantara', 'Velours, Andere']
+
+WORDS = ['gepflegt', 'scheckheft', 'tuev', 'neu', 'motor', 'getriebe', 'rost', 'unfallfrei', 'winterreifen', 'garage']
+
+
+def generate_car(ad_id, rng, now):
+    first_registration = now - timedelta(days=rng.randint(100, 365 * 20))
+    first_seen_at = now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+    kw = rng.randint(40, 300)
+
+    technical = {
+        'mileage': '{:,} km'.format(rng.randint(0, 400000)).replace(',', '.'),
+        'firstRegistration': first_registration.strftime('%m/%Y'),
+        'power': '%d kW (%d PS)' % (kw, kw * 1.36),
+        'emissionClass': rng.choice(['Euro4', 'Euro5', 'Euro6']),
+        'transmission': rng.choice(['Schaltgetriebe', 'Automatik']),
+    }
+    if rng.random() < 0.9:
+        technical['cubicCapacity'] = '{:,} cm³'.format(rng.randint(900, 5000)).replace(',', '.')
+    if rng.random() < 0.8:
+        technical['hu'] = rng.choice(['Neu', (now + timedelta(days=rng.randint(-60, 730))).strftime('%m/%Y')])
+    if rng.random() < 0.7:
+        technical['numberOfPreviousOwners'] = str(rng.randint(1, 5))
+    if rng.random() < 0.8:
+        technical['interior'] = rng.choice(INTERIORS)
+    if rng.random() < 0.5:
+        technical['climatisation'] = rng.choice(['Klimaanlage', 'Klimaautomatik'])
+
+    features = None
+    if rng.random() < 0.95:
+        features = rng.sample(FEATURES, rng.randint(0, 40))
+
+    description = None
+    if rng.random() < 0.9:
+        words = [rng.choice(WORDS) for _ in range(rng.randint(5, 80))]
+        if rng.random() < 0.02:
+            words.append('rechtslenker')
+        if rng.random() < 0.05:
+            words.append('lpg')
+        description = {'text': ' '.join(words)}
+
+    return {
+        'crawler': {
+            'first_seen_at': str(first_seen_at),
+            'created_at': str(first_seen_at),
+            'updated_at': str(first_seen_at),
+            'last_seen_at': str(now),
+        },
+        'mobile': {
+            'ad_id': ad_id,
+            'dart': {
+                'ad': {'price': str(rng.randint(500, 80000))},
+                'adFirstRegYear': str(first_registration.year),
+                'adSpecificsFuel': rng.choice(FUELS),
+            },
+            'web': {
+                'technical': technical,
+                'features': features,
+                'description': description,
+            },
+        },
+    }
+
+
+def generate_cars(n, seed=0, first_ad_id=200000000):
+    rng = random.Random(seed)
+    now = datetime.now()
+    return [generate_car(first_ad_id + i, rng, now) for i in range(n)]
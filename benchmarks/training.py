@@ -0,0 +1,53 @@
+import sys
+import time
+import tracemalloc
+
+from sklearn.model_selection import cross_val_score
+
+from benchmarks import synthetic
+from prediction import predictor
+
+SIZE = 20000
+
+
+def benchmark(backend, X, y):
+    regressor = predictor.create_regressor(backend)
+    X_input = predictor.Predictor(backend=backend).to_input(X)
+
+    # peak memory of the fit in this process, worker processes are not included
+    tracemalloc.start()
+    start = time.perf_counter()
+    regressor.fit(X_input, y)
+    fit_seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    scores = cross_val_score(predictor.create_regressor(backend), X_input, y, cv=predictor.CROSS_VALIDATION_FOLDS,
+                             scoring='neg_mean_absolute_error', n_jobs=predictor.CROSS_VALIDATION_JOBS)
+    cross_validation_seconds = time.perf_counter() - start
+
+    return {
+        'backend': backend,
+        'fit_seconds': fit_seconds,
+        'peak_memory_mb': peak / 1024 / 1024,
+        'cross_validation_seconds': cross_validation_seconds,
+        'cross_validated_mae': -scores.mean(),
+    }
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else SIZE
+    backends = sys.argv[2:] or predictor.BACKENDS
+
+    # same matrix for every backend
+    X, y = predictor.Predictor().prepare_training_data(synthetic.generate_cars(n))
+
+    for backend in backends:
+        result = benchmark(backend, X, y)
+        print('%-24s fit %8.2fs  peak %8.1f MB  cv %8.2fs  cv mae %10.1f' % (
+            backend, result['fit_seconds'], result['peak_memory_mb'], result['cross_validation_seconds'], result['cross_validated_mae']))
+
+
+if __name__ == '__main__':
+    main()
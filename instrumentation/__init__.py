@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# prefix of all exported metric names
+NAMESPACE = 'find_underpriced_cars'
+
+# seconds between two snapshots written by exporting()
+EXPORT_INTERVAL = 60
+
+_lock = threading.Lock()
+_counters = {}  # name -> value
+_timers = {}  # name -> [count, total seconds, max seconds]
+_gauges = {}  # (name, sorted label items) -> last value
+
+
+def increment(name, value=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[(name, tuple(sorted(labels.items())))] = value
+
+
+def record(name, seconds):
+    with _lock:
+        timer = _timers.get(name)
+        if timer is None:
+            _timers[name] = [1, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+
+@contextmanager
+def timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timed(name):
+    # decorator version of timer()
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+        _gauges.clear()
+
+
+def snapshot():
+    with _lock:
+        return {
+            'created_at': time.time(),
+            'counters': dict(_counters),
+            'timers': {name: {'count': count, 'seconds': seconds, 'max_seconds': max_seconds} for name, (count, seconds, max_seconds) in _timers.items()},
+            'gauges': {_format_labels(name, labels): value for (name, labels), value in _gauges.items()},
+        }
+
+
+def to_json():
+    return json.dumps(snapshot(), indent=2, sort_keys=True)
+
+
+def to_prometheus():
+    # text exposition format: counters as *_total, timers as summaries in seconds
+    state = snapshot()
+    lines = []
+    for name, value in sorted(state['counters'].items()):
+        metric = '%s_%s_total' % (NAMESPACE, name)
+        lines.append('# TYPE %s counter' % metric)
+        lines.append('%s %s' % (metric, value))
+    for name, timer_state in sorted(state['timers'].items()):
+        metric = '%s_%s_seconds' % (NAMESPACE, name)
+        lines.append('# TYPE %s summary' % metric)
+        lines.append('%s_count %d' % (metric, timer_state['count']))
+        lines.append('%s_sum %f' % (metric, timer_state['seconds']))
+        lines.append('# TYPE %s_max gauge' % metric)
+        lines.append('%s_max %f' % (metric, timer_state['max_seconds']))
+    with _lock:
+        gauges = sorted(_gauges.items())
+    typed = set()
+    for (name, labels), value in gauges:
+        metric = '%s_%s' % (NAMESPACE, name)
+        if metric not in typed:
+            lines.append('# TYPE %s gauge' % metric)
+            typed.add(metric)
+        lines.append('%s %s' % (_format_labels(metric, labels), value))
+    return '\n'.join(lines) + '\n'
+
+
+def _format_labels(name, labels):
+    if len(labels) == 0:
+        return name
+    return '%s{%s}' % (name, ','.join('%s="%s"' % (key, value) for key, value in labels))
+
+
+def save(path):
+    # .prom files get the Prometheus text format (e.g. for the node exporter textfile collector), anything else JSON
+    content = to_prometheus() if path.endswith('.prom') else to_json()
+    temporary_path = '%s.%d.tmp' % (path, threading.get_ident())
+    with open(temporary_path, 'w') as file:
+        file.write(content)
+    os.replace(temporary_path, path)
+
+
+@contextmanager
+def exporting(path, interval=EXPORT_INTERVAL):
+    # writes snapshots to path every interval seconds and once at the end, does nothing without a path
+    if path is None:
+        yield
+        return
+
+    stopped = threading.Event()
+
+    def export():
+        while not stopped.wait(interval):
+            save(path)
+
+    thread = threading.Thread(target=export, name='metrics-exporter', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+        save(path)
@@ -0,0 +1,82 @@
+import cProfile
+import logging
+import os
+import sys
+import threading
+from contextlib import contextmanager
+
+MODES = ['cprofile', 'sampling']
+
+# seconds between two stack samples
+SAMPLING_INTERVAL = 0.005
+
+
+class Sampler(object):
+    # samples the stacks of all threads, output is in the collapsed format of py-spy and flamegraph.pl
+    interval = None
+
+    def __init__(self, interval=SAMPLING_INTERVAL):
+        self.interval = interval
+        self._stacks = {}  # collapsed stack -> number of samples
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            for stack, count in sorted(self._stacks.items(), key=lambda item: -item[1]):
+                file.write('%s %d\n' % (stack, count))
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stopped.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                collapsed = ';'.join(reversed(stack))
+                self._stacks[collapsed] = self._stacks.get(collapsed, 0) + 1
+
+
+@contextmanager
+def profile(path, mode='cprofile'):
+    # cprofile writes pstats output, sampling writes collapsed stacks, does nothing without a path
+    if path is None:
+        yield
+        return
+
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            logging.info('wrote profile to %s' % path)
+    elif mode == 'sampling':
+        sampler = Sampler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            sampler.save(path)
+            logging.info('wrote sampled stacks to %s' % path)
+    else:
+        raise ValueError('unknown profiling mode: %s' % mode)
@@ -1,8 +1,23 @@
+import argparse
+import logging
+
+import instrumentation
 import scraping
+from instrumentation import profiling
 
 
 def main():
-    scraping.run()
+    parser = argparse.ArgumentParser(description='scrape used car ads')
+    parser.add_argument('--metrics', default=None, help='file for metric snapshots, Prometheus text for .prom, JSON otherwise')
+    parser.add_argument('--profile', default=None, help='file for profiling output')
+    parser.add_argument('--profile-mode', default='cprofile', choices=profiling.MODES,
+                        help='deterministic cProfile stats or sampled stacks in collapsed format')
+    parser.add_argument('--verbose', action='store_true', help='log every ad')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    with instrumentation.exporting(args.metrics), profiling.profile(args.profile, mode=args.profile_mode):
+        scraping.run()
 
 if __name__ == '__main__':
     main()
@@ -1,8 +1,56 @@
+import argparse
+import logging
+import sys
+
+import instrumentation
 import prediction
+from instrumentation import profiling
+from prediction import online
+from prediction import streaming
+from prediction.predictor import Predictor
 
 
 def main():
-    prediction.main()
+    parser = argparse.ArgumentParser(description='find underpriced cars')
+    parser.add_argument('mode', nargs='?', choices=['all', 'train', 'score', 'online', 'stream'], default='all',
+                        help='train and score in one run (all), only train and save the model, only load the model and score, '
+                             'keep scraping while updating the model incrementally (online), '
+                             'or score cars while they are scraped and emit deals as JSON lines (stream)')
+    parser.add_argument('--model', default=prediction.MODEL_PATH, help='path of the model artifact')
+    parser.add_argument('--backend', default=prediction.DEFAULT_BACKEND, choices=prediction.predictor.BACKENDS,
+                        help='regressor used for training')
+    parser.add_argument('--threshold', type=int, default=streaming.DIFFERENCE_THRESHOLD,
+                        help='maximum difference between listed and inferred price for a deal (stream)')
+    parser.add_argument('--output', default=None, help='JSON lines file for deals, stdout by default (stream)')
+    parser.add_argument('--metrics', default=None, help='file for metric snapshots, Prometheus text for .prom, JSON otherwise')
+    parser.add_argument('--profile', default=None, help='file for profiling output')
+    parser.add_argument('--profile-mode', default='cprofile', choices=profiling.MODES,
+                        help='deterministic cProfile stats or sampled stacks in collapsed format')
+    parser.add_argument('--verbose', action='store_true', help='log every ad')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    with instrumentation.exporting(args.metrics), profiling.profile(args.profile, mode=args.profile_mode):
+        run(args)
+
+
+def run(args):
+    if args.mode == 'train':
+        prediction.train(model_path=args.model, backend=args.backend)
+    elif args.mode == 'score':
+        prediction.score(model_path=args.model)
+    elif args.mode == 'online':
+        online.run(model_path=args.model, backend=args.backend)
+    elif args.mode == 'stream':
+        predictor = Predictor.load(args.model)
+        predictor.history = prediction.load_history_features()
+        if args.output is None:
+            streaming.stream_deals(predictor, threshold=args.threshold, sink=sys.stdout)
+        else:
+            with open(args.output, 'a') as sink:
+                streaming.stream_deals(predictor, threshold=args.threshold, sink=sink)
+    else:
+        prediction.main(backend=args.backend)
 
 if __name__ == '__main__':
     main()
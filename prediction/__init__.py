@@ -1,158 +1,167 @@
+import hashlib
 import json
 import logging
 import os
 import re
 from datetime import datetime
-from time import sleep
 
 import numpy
 import pandas
-import requests
-import sklearn
-from graphviz import Source
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.feature_selection import SelectKBest
-from sklearn.feature_selection import mutual_info_regression
 
+import instrumentation
 import scraping
+import storage
+from prediction import dataset
+from prediction.predictor import DEFAULT_BACKEND
 from prediction.predictor import Predictor
 
 SECONDS_TO_YEARS_FACTOR = 1 / (60 * 60 * 24 * 365)
 
+MODEL_PATH = os.getcwd() + '/model.joblib'
 
-def main():
+
+def main(backend=DEFAULT_BACKEND):
     # start = datetime.now()
-    cars = load_cars()
-    predictor = Predictor()
+    cars = load_frame()
+    predictor = Predictor(backend=backend)
+    predictor.history = load_history_features()
+    predictor.train(cars, cross_validate=False)
+
+    score(predictor)
+
+
+def train(model_path=MODEL_PATH, backend=DEFAULT_BACKEND):
+    cars = load_frame()
+    predictor = Predictor(backend=backend)
+    predictor.history = load_history_features()
     predictor.train(cars, cross_validate=False)
+    predictor.save(model_path)
+
+
+def score(predictor=None, model_path=MODEL_PATH):
+    if predictor is None:
+        predictor = Predictor.load(model_path)
+        predictor.history = load_history_features()
 
     new_cars = scraping.scrape_search(scraping.SEARCH_PREDICTION)
     predictions = predictor.predict(new_cars)
     print_best_predictions(predictions, n=500, ensure_online=True)
 
 
-def preprocess(cars):
-    df = pandas.DataFrame()
+def get_fingerprint(df):
+    # identifies the training data: number of cars plus a hash over ids and prices
+    digest = hashlib.sha1()
+    digest.update(numpy.sort(df.index.to_numpy(dtype=numpy.int64)).tobytes())
+    digest.update(numpy.sort(df['price'].to_numpy(dtype=numpy.int64)).tobytes())
+    return {
+        'cars': len(df),
+        'sha1': digest.hexdigest(),
+    }
+
+
+@instrumentation.timed('preprocess')
+def preprocess(cars, history=None):
+    # flatten once, then build every column with vectorized operations
+    # history is an optional frame of per-ad history features, indexed by ad id
+    flat = flatten(cars)
+    technical = {key: flat['technical.' + key] for key in dataset.TECHNICAL_KEYS}
+    now = datetime.now()
+
+    df = pandas.DataFrame(index=flat.index)
 
     # already pre-processed columns
-    df['id'] = pandas.Series([car['mobile']['ad_id'] for car in cars])
-    df['price'] = pandas.Series([int(car['mobile']['dart']['ad']['price']) for car in cars], dtype=int)
-    df['first_reg_year'] = pandas.Series([float(car['mobile']['dart']['adFirstRegYear']) for car in cars])
-    df['mileage_in_km'] = pandas.Series([float(extract_number_from_string(car['mobile']['web']['technical']['mileage'])) for car in cars])
-    df['car_age'] = pandas.Series([get_car_age_in_years(car) for car in cars])
-    df['km_per_year'] = df[['mileage_in_km', 'car_age']].apply(lambda x: x[0] / x[1], axis=1)
-    df['time_to_hu'] = pandas.Series([get_time_to_hu(car) for car in cars])
-    df['ps'] = pandas.Series([get_ps(car) for car in cars])
-    df['cc'] = pandas.Series([get_cc(car) for car in cars])
-    df['prev_owners'] = pandas.Series([get_prev_owners(car) for car in cars])
-    df['ps_per_cc'] = pandas.Series([get_ps(car) / get_cc(car) for car in cars])
-
-    # df['maker'] = pandas.Series([car['mobile']['dart']['adSpecificsMake'] for car in cars])
-    # df['model'] = pandas.Series([car['mobile']['dart']['adSpecificsModel'] for car in cars])
+    df['id'] = flat['ad_id']
+    df['price'] = flat['price'].astype(int)
+    df['first_reg_year'] = flat['first_reg_year'].astype(float)
+    df['mileage_in_km'] = extract_numbers(technical['mileage']).astype(float)
+    first_registration = pandas.to_datetime(technical['firstRegistration'], format='%m/%Y')
+    df['car_age'] = (now - first_registration).dt.total_seconds() * SECONDS_TO_YEARS_FACTOR
+    df['km_per_year'] = df['mileage_in_km'] / df['car_age']
+    df['time_to_hu'] = get_time_to_hu(technical['hu'], now)
+    df['ps'] = to_int_if_complete(pandas.to_numeric(technical['power'].str.findall(r'\d+').str[1]))
+    df['cc'] = extract_numbers(technical['cubicCapacity'])
+    df['prev_owners'] = to_int_if_complete(pandas.to_numeric(technical['numberOfPreviousOwners']))
+    df['ps_per_cc'] = df['ps'] / df['cc']
 
     # special columns
-    df['fuel'] = pandas.Series([car['mobile']['dart'].get('adSpecificsFuel', None) for car in cars])
-
-    # features
-    features = set()
-    for car in cars:
-        if car['mobile']['web']['features'] is not None:
-            for feature in car['mobile']['web']['features']:
-                features.add(feature)
-    for feature_name in features:
-        values = []
-        for car in cars:
-            value = car['mobile']['web']['features'] is not None and feature_name in car['mobile']['web']['features']
-            values.append(float(value))
-
-        df['feature_' + feature_name] = pandas.Series(values)
+    df['fuel'] = flat['fuel']
+
+    # equipment features stay lists, they are encoded sparsely by the predictor
+    df['features'] = flat['features']
 
     # tech details as strings
-    technical = pandas.DataFrame([car['mobile']['web']['technical'] for car in cars])
     included_keys = ['interior', 'emissionClass', 'climatisation', 'countryVersion', 'damageCondition', 'export', 'transmission']
-    selected_keys = [column for column in included_keys if column in list(technical.columns.values)]  # avoid columns not seen in sample
-    technical = technical[selected_keys]
+    selected_keys = [key for key in included_keys if technical[key].notnull().any()]  # avoid columns not seen in sample
+    df_technical = pandas.DataFrame({key: technical[key] for key in selected_keys if key != 'interior'}, index=flat.index)
     # extract interior
-    technical['interior_type'] = technical.apply(lambda row: extract_interior_type(row['interior']) if row['interior'] is not numpy.NaN else 'unknown', axis=1)
-    technical['interior_color'] = technical.apply(lambda row: extract_interior_color(row['interior']) if row['interior'] is not numpy.NaN else 'unknown', axis=1)
-    del technical['interior']
-    df = pandas.concat([df, technical], axis=1)
+    interior = technical['interior']
+    interior_parts = interior.str.split(', ')
+    df_technical['interior_type'] = interior_parts.str[0].where(interior.notnull(), 'unknown')
+    df_technical['interior_color'] = interior_parts.str[1].where(interior.notnull(), 'unknown')
+    df = pandas.concat([df, df_technical], axis=1)
 
-    # add data from dart
-    # df['maker'] = pandas.Series([car['mobile']['dart']['adSpecificsMake'] for car in cars])
-
-    # money_words = get_money_words(cars, df)
-    # df = pandas.concat([df, money_words], axis=1)
+    # descriptions stay text, they are hashed into sparse n-gram features by the predictor
+    texts = flat['description_text'].fillna('')
+    df['description'] = texts
 
     # todo rechtslenker
-    df['is_rechtslenker'] = pandas.Series(['rechtslenker' in text for text in get_texts_from_cars(cars)], dtype=int)
+    df['is_rechtslenker'] = texts.str.contains('rechtslenker', regex=False).astype(int)
 
     # todo gas / lpg
-    df['is_lpg'] = pandas.Series(['lpg' in text for text in get_texts_from_cars(cars)], dtype=int)
+    df['is_lpg'] = texts.str.contains('lpg', regex=False).astype(int)
 
     # key by id
     df = df.set_index('id')
 
+    if history is not None:
+        df = df.join(history)
+
     return df
 
 
+def flatten(cars):
+    if isinstance(cars, pandas.DataFrame):
+        return cars.reset_index(drop=True)
+    rows = [dataset.flatten_car(car) for car in cars]
+    return pandas.DataFrame.from_records(rows, columns=dataset.SCHEMA.names)
+
+
 def print_best_predictions(predictions, n=100, ensure_online=False):
     best_predictions = sorted(predictions, key=lambda p: p['price']['difference'])
+    if ensure_online:
+        # checked concurrently in best-first batches, stops once n live ads are found
+        checker = scraping.create_liveness_checker()
+        predictions_by_id = {prediction['car_id']: prediction for prediction in best_predictions}
+        live_ids = checker.iterate_alive(prediction['car_id'] for prediction in best_predictions)
+        best_predictions = (predictions_by_id[car_id] for car_id in live_ids)
+    else:
+        checker = None
+
     shown = 0
     for prediction in best_predictions:
-        sleep(0.5)
-        url = 'https://suchen.mobile.de/fahrzeuge/details.html?id=%s' % prediction['car_id']
-        if not ensure_online or requests.get(url).status_code == 200:
-            shown += 1
-            print(url)
-            print('listed with:  %d' % prediction['price']['actual'])
-            print('worth around: %d' % prediction['price']['inferred'])
-            print('difference:   %d' % prediction['price']['difference'])
+        url = scraping.get_ad_url(prediction['car_id'])
+        shown += 1
+        print(url)
+        print('listed with:  %d' % prediction['price']['actual'])
+        print('worth around: %d' % prediction['price']['inferred'])
+        print('difference:   %d' % prediction['price']['difference'])
 
         if shown >= n:
-            return
+            break
+
+    if checker is not None:
+        checker.save()
 
 
 def get_dummies_for_all(dataframe):
     return pandas.concat([pandas.get_dummies(dataframe[col]) for col in dataframe], axis=1, keys=dataframe.columns)
 
 
-def get_money_words(cars, df, top=10):
-    texts = get_texts_from_cars(cars)
-
-    tfidf_vectorizer = TfidfVectorizer(ngram_range=(2, 5), max_features=top*10, max_df=0.75)
-    tfidfs = tfidf_vectorizer.fit_transform(texts)
-
-    k_best = SelectKBest(mutual_info_regression, k=top)
-    X_new = k_best.fit_transform(tfidfs, df.price)
-
-    k_best_feature_indices = k_best.get_support(True).tolist()
-    k_best_column_names = ['contains=' + tfidf_vectorizer.get_feature_names()[i] for i in k_best_feature_indices]
-    return pandas.DataFrame(X_new.todense(), columns=k_best_column_names)
-
-
-def get_texts_from_cars(cars):
-    texts = []
-    for car in cars:
-        if car['mobile']['web']['description'] is not None:
-            texts.append(car['mobile']['web']['description'].get('text', ''))
-        else:
-            texts.append('')
-    return texts
-
-
-def extract_interior_type(desc):
-    return desc.split(', ')[0]
-
-
-def extract_interior_color(desc):
-    parts = desc.split(', ')
-    if len(parts) > 1:
-        return parts[1]
-    return numpy.NaN
-
-
 def load_cars(sample=None, after=None):
+    # prefer the compacted dataset, filters are pushed down to the parquet reader
+    if dataset.exists():
+        return dataset.read_cars(sample=sample, after=after)
+
     cars = []
     directory = os.getcwd() + '/cars'
     file_list = os.listdir(directory)
@@ -172,6 +181,27 @@ def load_cars(sample=None, after=None):
     return cars
 
 
+def load_history_features():
+    # price history aggregated per ad, None without a history store
+    if not os.path.exists(storage.HISTORY_PATH):
+        return None
+
+    rows = storage.get_price_history().aggregate()
+    history = pandas.DataFrame(rows, columns=['id', 'history_observations', 'first_observed_at', 'max_price', 'latest_price'])
+    history['history_price_drop'] = (history['max_price'] - history['latest_price']).astype(float)
+    first_observed_at = pandas.to_datetime(history['first_observed_at'], format='ISO8601')
+    history['history_days_listed'] = (datetime.now() - first_observed_at).dt.total_seconds() / (60 * 60 * 24)
+    history['history_observations'] = history['history_observations'].astype(float)
+    return history.set_index('id')[['history_observations', 'history_price_drop', 'history_days_listed']]
+
+
+def load_frame(sample=None, after=None):
+    # flat frame for preprocess, reading only the columns it needs
+    if dataset.exists():
+        return dataset.read_frame(sample=sample, after=after)
+    return flatten(load_cars(sample=sample, after=after))
+
+
 def extract_price(car):
     price_raw = car['mobile']['web']['price'].replace('.', '')
     price = int(re.findall(r'\d+', price_raw)[0])
@@ -183,49 +213,31 @@ def extract_number_from_string(string):
     return int(re.findall(r'\d+', number_without_dots)[0])
 
 
-def get_car_age_in_years(car):
-    first_registration_raw = car['mobile']['web']['technical']['firstRegistration']
-    first_registration = datetime.strptime(first_registration_raw, '%m/%Y')
-    return (datetime.now() - first_registration).total_seconds() * SECONDS_TO_YEARS_FACTOR
-
+def extract_numbers(strings):
+    # first number in each string, ignoring thousands separators
+    numbers = strings.str.replace('.', '', regex=False).str.extract(r'(\d+)', expand=False)
+    return to_int_if_complete(pandas.to_numeric(numbers))
 
-def get_time_to_hu(car):
-    time_to_hu = numpy.NaN
-    if 'hu' in car['mobile']['web']['technical']:
-        hu_raw = car['mobile']['web']['technical']['hu']
-        if hu_raw == 'Neu':
-            time_to_hu = 2.0
-        else:
-            hu = datetime.strptime(hu_raw, '%m/%Y')
-            time_to_hu = (hu - datetime.now()).total_seconds() * SECONDS_TO_YEARS_FACTOR
-
-    return time_to_hu
 
+def to_int_if_complete(series):
+    # keep integer columns integer unless values are missing
+    if series.notnull().all():
+        return series.astype(int)
+    return series.astype(float)
 
-def get_ps(car):
-    power_in_ps = numpy.NaN
-    if 'power' in car['mobile']['web']['technical']:
-        power_raw = car['mobile']['web']['technical']['power']
-        power_in_ps = int(re.findall(r'\d+', power_raw)[1])
-    return power_in_ps
 
-
-def get_prev_owners(car):
-    owners = numpy.NaN
-    if 'numberOfPreviousOwners' in car['mobile']['web']['technical']:
-        owners = int(car['mobile']['web']['technical']['numberOfPreviousOwners'])
-    return owners
-
-
-def get_cc(car):
-    if 'cubicCapacity' in car['mobile']['web']['technical']:
-        cubic_capacity_raw = car['mobile']['web']['technical']['cubicCapacity'].replace('.', '')
-        cubic_capacity = int(re.findall(r'\d+', cubic_capacity_raw)[0])
-        return cubic_capacity
-    return numpy.NaN
+def get_time_to_hu(hu_raw, now):
+    hu = pandas.to_datetime(hu_raw.where(hu_raw != 'Neu'), format='%m/%Y')
+    time_to_hu = (hu - now).dt.total_seconds() * SECONDS_TO_YEARS_FACTOR
+    time_to_hu[hu_raw == 'Neu'] = 2.0
+    return time_to_hu
 
 
 def generate_tree_visualization(regr, feature_names):
+    # imported here, only needed for debugging the tree
+    import sklearn.tree
+    from graphviz import Source
+
     dot_filename = "tree.dot"
     gv_filename = 'tree.gv'
 
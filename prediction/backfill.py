@@ -0,0 +1,122 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from time import monotonic
+
+import scraping
+import storage
+from prediction import dataset
+
+CHECKPOINT_PATH = os.getcwd() + '/backfill_checkpoint.json'
+
+BATCH_SIZE = 1000
+
+
+def read_batch(ads):
+    # next batch of (ad_id, html, metadata), None after the last ad
+    # ads stored without metadata are dated by their storage time, not by the time of the backfill
+    batch = [(ad_id, html, storage.get_metadata(ad_id) or storage.seed_metadata(ad_id, html)) for ad_id, html in itertools.islice(ads, BATCH_SIZE)]
+    return batch if len(batch) > 0 else None
+
+
+def extract(loaded):
+    # runs in a worker process
+    ad_id, html, metadata = loaded
+    try:
+        car = scraping.extract_data_from_ad(html, scraping.get_ad_url(ad_id), metadata)
+    except Exception as e:
+        return ad_id, None, type(e).__name__
+
+    if car is None:
+        return ad_id, None, 'NoData'
+    return ad_id, car, None
+
+
+def new_checkpoint():
+    return {'processed': 0, 'last_ad_id': None, 'extracted': 0, 'failures': {}}
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return new_checkpoint()
+    with open(path) as file:
+        return dict(new_checkpoint(), **json.load(file))
+
+
+def save_checkpoint(checkpoint, path):
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w') as file:
+        json.dump(checkpoint, file)
+    os.replace(temporary_path, path)
+
+
+def run(directory=dataset.DATASET_DIRECTORY, workers=None, checkpoint_path=CHECKPOINT_PATH, restart=False):
+    # re-extract every stored ad into the dataset, resumable after the last written batch
+    # rows are appended, reads keep the newest row per ad, so cars that are not stored as html stay
+    checkpoint = load_checkpoint(checkpoint_path)
+    if restart or checkpoint['last_ad_id'] is None:
+        checkpoint = new_checkpoint()
+    else:
+        logging.info('resuming backfill after ad %d (%d ads done)' % (checkpoint['last_ad_id'], checkpoint['processed']))
+
+    # ascending ids, so the last written id is enough to resume
+    ads = storage.iterate_ads(after_ad_id=checkpoint['last_ad_id'])
+
+    start = monotonic()
+    processed = 0
+    with ThreadPoolExecutor(max_workers=1) as reader, ProcessPoolExecutor(max_workers=workers) as process_pool:
+        reading = reader.submit(read_batch, ads)
+        while True:
+            batch = reading.result()
+            if batch is None:
+                break
+            # read the next batch while this one is extracted
+            reading = reader.submit(read_batch, ads)
+
+            cars = []
+            for ad_id, car, error in process_pool.map(extract, batch, chunksize=16):
+                if error is not None:
+                    checkpoint['failures'][error] = checkpoint['failures'].get(error, 0) + 1
+                else:
+                    cars.append(car)
+
+            dataset.write(cars, directory)
+            checkpoint['processed'] += len(batch)
+            checkpoint['last_ad_id'] = batch[-1][0]
+            checkpoint['extracted'] += len(cars)
+            save_checkpoint(checkpoint, checkpoint_path)
+
+            processed += len(batch)
+            logging.info('backfilled %d ads (%.1f ads/sec), failures: %s' % (checkpoint['processed'], processed / (monotonic() - start), checkpoint['failures']))
+
+    # the next run starts over
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    report = {
+        'processed': processed,
+        'ads_per_second': processed / (monotonic() - start),
+        'extracted': checkpoint['extracted'],
+        'failures': checkpoint['failures'],
+    }
+    logging.info('backfill finished: %s' % report)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='re-extract all stored ads into the car dataset')
+    parser.add_argument('--directory', default=dataset.DATASET_DIRECTORY, help='dataset directory to write to')
+    parser.add_argument('--workers', type=int, default=None, help='extraction processes, all cores by default')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_PATH, help='checkpoint file for resuming')
+    parser.add_argument('--restart', action='store_true', help='ignore an existing checkpoint')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    run(directory=args.directory, workers=args.workers, checkpoint_path=args.checkpoint, restart=args.restart)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+import json
+import logging
+import os
+import uuid
+
+import numpy
+import pyarrow
+import pyarrow.compute
+import pyarrow.dataset
+import pyarrow.parquet
+
+DATASET_DIRECTORY = os.getcwd() + '/dataset'
+
+CARS_DIRECTORY = os.getcwd() + '/cars'
+
+# technical details used by preprocess, stored as technical.<key> columns
+TECHNICAL_KEYS = [
+    'mileage', 'firstRegistration', 'hu', 'power', 'cubicCapacity', 'numberOfPreviousOwners',
+    'interior', 'emissionClass', 'climatisation', 'countryVersion', 'damageCondition', 'export', 'transmission',
+]
+
+SCHEMA = pyarrow.schema(
+    [
+        ('ad_id', pyarrow.int64()),
+        ('first_seen_at', pyarrow.string()),
+        ('updated_at', pyarrow.string()),
+        ('price', pyarrow.int64()),
+        ('first_reg_year', pyarrow.string()),
+        ('fuel', pyarrow.string()),
+        ('features', pyarrow.list_(pyarrow.string())),
+        ('description_text', pyarrow.string()),
+    ] + [('technical.' + key, pyarrow.string()) for key in TECHNICAL_KEYS] + [
+        ('crawl_date', pyarrow.string()),
+    ]
+)
+
+ROW_GROUP_SIZE = 64 * 1024
+
+BATCH_SIZE = 100000
+
+
+def flatten_car(car):
+    dart = car['mobile']['dart']
+    web = car['mobile']['web']
+    crawler = car.get('crawler', {})
+    first_seen_at = crawler.get('first_seen_at', crawler.get('created_at'))
+
+    row = {
+        'ad_id': car['mobile']['ad_id'],
+        'first_seen_at': first_seen_at,
+        'updated_at': crawler.get('updated_at'),
+        'price': int(dart['ad']['price']),
+        'first_reg_year': dart['adFirstRegYear'],
+        'fuel': dart.get('adSpecificsFuel', None),
+        'features': web['features'],
+        'description_text': web['description'].get('text', '') if web['description'] is not None else None,
+        'crawl_date': first_seen_at[:10] if first_seen_at is not None else 'unknown',
+    }
+    for key in TECHNICAL_KEYS:
+        row['technical.' + key] = web['technical'].get(key, None)
+    return row
+
+
+def unflatten_row(row):
+    # rebuild the subset of the car dict that preprocess reads
+    dart = {
+        'ad': {'price': row['price']},
+        'adFirstRegYear': row['first_reg_year'],
+    }
+    if row['fuel'] is not None:
+        dart['adSpecificsFuel'] = row['fuel']
+
+    technical = {}
+    for key in TECHNICAL_KEYS:
+        value = row.get('technical.' + key)
+        if value is not None:
+            technical[key] = value
+
+    description = None
+    if row['description_text'] is not None:
+        description = {'text': row['description_text']}
+
+    return {
+        'crawler': {'first_seen_at': row['first_seen_at'], 'updated_at': row.get('updated_at')},
+        'mobile': {
+            'ad_id': row['ad_id'],
+            'dart': dart,
+            'web': {
+                'technical': technical,
+                'features': list(row['features']) if row['features'] is not None else None,
+                'description': description,
+            },
+        },
+    }
+
+
+def is_complete(car):
+    return 'price' in car['mobile']['dart']['ad'] and 'adFirstRegYear' in car['mobile']['dart']
+
+
+def write(cars, directory=DATASET_DIRECTORY):
+    rows = []
+    for car in cars:
+        if is_complete(car):
+            rows.append(flatten_car(car))
+        else:
+            logging.warning('car without dart features: %s' % car['mobile']['dart'])
+    if len(rows) == 0:
+        return 0
+
+    # sorted rows give tight row group statistics for the first_seen_at filter
+    rows.sort(key=lambda row: row['first_seen_at'] or '')
+    table = pyarrow.Table.from_pylist(rows, schema=SCHEMA)
+    pyarrow.parquet.write_to_dataset(
+        table, directory, partition_cols=['crawl_date'],
+        basename_template='part-%s-{i}.parquet' % uuid.uuid4().hex,
+        row_group_size=ROW_GROUP_SIZE,
+    )
+    return len(rows)
+
+
+def compact(source_directory=CARS_DIRECTORY, directory=DATASET_DIRECTORY):
+    # convert the per-car json files into the partitioned parquet dataset
+    cars = []
+    written = 0
+    for filename in os.listdir(source_directory):
+        with open(os.path.join(source_directory, filename)) as file:
+            cars.append(json.loads(file.read()))
+
+        if len(cars) >= BATCH_SIZE:
+            written += write(cars, directory)
+            cars = []
+    written += write(cars, directory)
+
+    logging.info('compacted %d cars into %s' % (written, directory))
+    return written
+
+
+def exists(directory=DATASET_DIRECTORY):
+    return os.path.isdir(directory) and len(os.listdir(directory)) > 0
+
+
+def read_frame(columns=None, sample=None, after=None, directory=DATASET_DIRECTORY):
+    return read_table(columns, sample, after, directory).to_pandas()
+
+
+def read_table(columns=None, sample=None, after=None, directory=DATASET_DIRECTORY):
+    dataset = pyarrow.dataset.dataset(directory, format='parquet', partitioning='hive', schema=SCHEMA)
+    requested_columns = columns
+    if columns is not None:
+        columns = list(columns) + [name for name in ['ad_id', 'updated_at'] if name not in columns]
+
+    # partition pruning on the crawl date, row group pruning on the timestamp
+    filter = None
+    if after is not None:
+        after = str(after)
+        filter = (pyarrow.dataset.field('crawl_date') >= after[:10]) & (pyarrow.dataset.field('first_seen_at') > after)
+
+    if sample is not None:
+        table = dataset.head(sample, columns=columns, filter=filter)
+    else:
+        table = dataset.to_table(columns=columns, filter=filter)
+
+    table = keep_latest(table)
+    if requested_columns is not None:
+        table = table.select(requested_columns)
+    return table
+
+
+def keep_latest(table):
+    # ads are appended again when their content changes, the row with the newest updated_at wins
+    # rows without updated_at, like cars compacted from json, sort last
+    if pyarrow.compute.count_distinct(table['ad_id']).as_py() == table.num_rows:
+        return table
+    table = table.sort_by([('ad_id', 'ascending'), ('updated_at', 'descending')])
+    ad_ids = table['ad_id'].to_numpy()
+    first = numpy.ones(len(ad_ids), dtype=bool)
+    first[1:] = ad_ids[1:] != ad_ids[:-1]
+    return table.filter(first)
+
+
+def read_cars(sample=None, after=None, directory=DATASET_DIRECTORY):
+    table = read_table(sample=sample, after=after, directory=directory)
+    return [unflatten_row(row) for row in table.to_pylist()]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    compact()
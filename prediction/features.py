@@ -0,0 +1,98 @@
+import numpy
+import pandas
+import scipy.sparse
+
+# columns with these dtypes are copied, everything else is one-hot encoded
+NUMERIC_DTYPES = [numpy.float64, numpy.int64]
+
+
+class EquipmentVocabulary(object):
+    # stable mapping of equipment feature names to sparse matrix columns
+    vocabulary = None
+
+    def fit(self, features):
+        names = sorted(set(features.explode().dropna()))
+        self.vocabulary = {name: column for column, name in enumerate(names)}
+        return self
+
+    def transform(self, features):
+        exploded = features.reset_index(drop=True).explode().dropna()
+        columns = exploded.map(self.vocabulary).dropna()  # unknown features are dropped
+
+        data = numpy.ones(len(columns), dtype=numpy.float32)
+        rows = columns.index.to_numpy()
+        matrix = scipy.sparse.csr_matrix((data, (rows, columns.to_numpy(dtype=int))), shape=(len(features), len(self.vocabulary)))
+
+        # duplicate features of a car were summed up
+        matrix.data[:] = 1
+        return matrix
+
+    def get_column_names(self):
+        return ['feature_' + name for name in sorted(self.vocabulary, key=self.vocabulary.get)]
+
+
+class FrameEncoder(object):
+    # column layout fitted in train, every frame is encoded into the same float32 matrix layout
+    source_columns = None
+    categories = None  # column -> known values, unseen values go to the column's nan dummy
+    statistics = None  # column -> (sum, count) of the numeric values seen so far
+    fill_values = None  # column -> mean used for missing numeric values
+    columns = None  # encoded column names in matrix order
+
+    def fit(self, df):
+        self.source_columns = list(df.columns)
+        self.categories = {}
+        self.statistics = {}
+        self.fill_values = {}
+        self.columns = []
+        for column in self.source_columns:
+            values = df[column]
+            if values.dtype in NUMERIC_DTYPES:
+                self.statistics[column] = (float(values.sum()), int(values.count()))
+                self.fill_values[column] = self._get_mean(column)
+                self.columns.append(column)
+            else:
+                known = sorted(values.dropna().unique().tolist(), key=str)
+                self.categories[column] = known
+                self.columns.extend('%s_%s' % (column, value) for value in known)
+                self.columns.append('%s_nan' % column)
+        return self
+
+    def update(self, df):
+        # fold new rows into the fill-in means, the layout is kept until the next fit
+        for column in self.statistics:
+            if column not in df:
+                continue
+            total, count = self.statistics[column]
+            self.statistics[column] = (total + float(df[column].sum()), count + int(df[column].count()))
+            self.fill_values[column] = self._get_mean(column)
+
+    def transform(self, df):
+        X = numpy.zeros((len(df), len(self.columns)), dtype=numpy.float32)
+        rows = numpy.arange(len(df))
+        offset = 0
+        for column in self.source_columns:
+            if column in self.categories:
+                known = self.categories[column]
+                if column in df:
+                    codes = pandas.Categorical(df[column], categories=known).codes  # -1 for missing and unseen
+                else:
+                    codes = numpy.full(len(df), -1)
+                X[rows, offset + numpy.where(codes < 0, len(known), codes)] = 1
+                offset += len(known) + 1
+            else:
+                if column in df:
+                    X[:, offset] = df[column].fillna(self.fill_values[column]).to_numpy(dtype=numpy.float32)
+                else:
+                    X[:, offset] = self.fill_values[column]
+                offset += 1
+        return X
+
+    def _get_mean(self, column):
+        total, count = self.statistics[column]
+        return total / count if count > 0 else 0.0
+
+
+def to_matrix(dense, *blocks):
+    # dense columns followed by the sparse equipment and text blocks, ready for the regressor
+    return scipy.sparse.hstack([scipy.sparse.csr_matrix(dense)] + list(blocks), format='csr')
@@ -0,0 +1,79 @@
+import logging
+import os
+from datetime import datetime, timedelta
+
+import prediction
+import scraping
+from prediction import dataset
+from prediction.predictor import DEFAULT_BACKEND
+from prediction.predictor import Predictor
+
+# training data window for refits
+WINDOW = timedelta(days=30)
+
+# number of new cars after which the model is refit on the window
+REFIT_EVERY = 5000
+
+
+class OnlineTrainer(object):
+    predictor = None
+    window = None
+    refit_every = None
+    pending = None
+
+    def __init__(self, predictor=None, window=WINDOW, refit_every=REFIT_EVERY):
+        self.predictor = predictor if predictor is not None else Predictor()
+        self.window = window
+        self.refit_every = refit_every
+        self.pending = 0
+
+    def add(self, cars):
+        # append new and changed ads only, the rest are in the training store and the statistics already
+        changed_cars = [car for car in cars if is_changed(car)]
+        if len(changed_cars) == 0:
+            return False
+        dataset.write(changed_cars)
+        self.pending += len(changed_cars)
+
+        if self.predictor.regressor is None or self.pending >= self.refit_every:
+            # nothing to train on until complete cars were written
+            if not dataset.exists():
+                return False
+            self.refit()
+            return True
+
+        self.predictor.update_statistics(changed_cars)
+        return False
+
+    def refit(self):
+        after = str(datetime.now() - self.window)
+        cars = prediction.load_frame(after=after)
+        logging.info('refitting on %d cars seen after %s' % (len(cars), after))
+        self.predictor.train(cars, cross_validate=False)
+        self.pending = 0
+
+
+def is_changed(car):
+    # new or changed content when it was fetched, unchanged ads were seen again later than their update
+    crawler = car.get('crawler', {})
+    return crawler.get('updated_at') is None or crawler.get('updated_at') == crawler.get('last_seen_at')
+
+
+def run(model_path=prediction.MODEL_PATH, backend=DEFAULT_BACKEND, window=WINDOW, refit_every=REFIT_EVERY):
+    predictor = Predictor(backend=backend)
+    if os.path.exists(model_path):
+        predictor = Predictor.load(model_path)
+    predictor.history = prediction.load_history_features()
+    trainer = OnlineTrainer(predictor, window=window, refit_every=refit_every)
+
+    ad_ids = scraping.load_seen_cache()
+    while True:
+        for parameters in scraping.PARAMETERS_TO_SCRAPE:
+            cars = scraping.scrape_search(parameters, ad_ids=ad_ids)
+            ad_ids.save(scraping.SEEN_CACHE_PATH)
+            if trainer.add(cars):
+                trainer.predictor.save(model_path)
+
+            if trainer.predictor.regressor is not None and len(cars) > 0:
+                predictions = trainer.predictor.predict(cars)
+                prediction.print_best_predictions(predictions, n=10)
@@ -1,112 +1,189 @@
 import logging
-import numpy
-import pandas
-from sklearn.model_selection import cross_val_score
+from datetime import datetime
+
+import joblib
 from sklearn.tree import DecisionTreeRegressor
 
+import instrumentation
 import prediction
+from prediction import features
+from prediction import text
+from prediction.features import EquipmentVocabulary
+from prediction.features import FrameEncoder
+from prediction.text import TextFeatures
+
+
+MODEL_FORMAT_VERSION = 3
+
+BACKENDS = ['tree', 'hist_gradient_boosting', 'random_forest']
+
+DEFAULT_BACKEND = 'tree'
+
+# backends that cannot take the sparse feature matrix
+DENSE_BACKENDS = ['hist_gradient_boosting']
+
+CROSS_VALIDATION_FOLDS = 5
+
+# folds run in a process pool, -1 uses all cores
+CROSS_VALIDATION_JOBS = -1
+
+
+def create_regressor(backend):
+    if backend == 'tree':
+        # DecisionTreeRegressor(criterion='mae', min_samples_leaf=100, min_impurity_split=1000)  # 86%
+        # DecisionTreeRegressor(criterion='mae', min_samples_leaf=50, min_impurity_split=750)  # 87%
+        return DecisionTreeRegressor(criterion='absolute_error', min_samples_leaf=50)  # 87%, 'mae' before sklearn 1.0
+    # ensembles are imported on demand, scoring with the default tree does not need them
+    if backend == 'hist_gradient_boosting':
+        from sklearn.ensemble import HistGradientBoostingRegressor
+        return HistGradientBoostingRegressor(loss='absolute_error', min_samples_leaf=50)
+    if backend == 'random_forest':
+        from sklearn.ensemble import RandomForestRegressor
+        return RandomForestRegressor(n_estimators=100, min_samples_leaf=10, n_jobs=-1)
+    raise ValueError('unknown regressor backend: %s' % backend)
 
 
 class Predictor(object):
+    backend = None
     regressor = None
-    selected_columns = None
-
-    def predict(self, cars):
-        df = prediction.preprocess(cars)
-        df = self.prepare(df)
+    encoder = None
+    equipment = None
+    text = None
+    fingerprint = None
+    history = None  # optional per-ad history features, not saved with the model
+
+    def __init__(self, backend=DEFAULT_BACKEND):
+        self.backend = backend
+
+    @instrumentation.timed('predict')
+    def predict(self, cars, chunk_size=None):
+        # optionally score in chunks of cars to bound memory
+        if chunk_size is None:
+            return self.predict_chunk(cars)
+
+        predictions = {}
+        for start in range(0, len(cars), chunk_size):
+            for price_prediction in self.predict_chunk(cars[start:start + chunk_size]):
+                predictions[price_prediction['car_id']] = price_prediction  # duplicates across chunks, keep last
+        return list(predictions.values())
+
+    def predict_chunk(self, cars):
+        df = prediction.preprocess(cars, history=self.history)
 
         # remove duplicate ids
         # todo find out why there are duplicates: duplicate results?
-        df = df.groupby(level=0).last()
+        df = df[~df.index.duplicated(keep='last')]
+
+        equipment = df.pop('features')
+        descriptions = df.pop('description')
+        prices_actual = df.pop('price').to_numpy()
 
-        # use trained columns and adapt it to current data frame
-        df_adapted = pandas.DataFrame()
-        for column in self.columns:
-            if column in df:
-                df_adapted[column] = df[column]
-            else:
-                df_adapted[column] = pandas.Series([0] * len(df))
+        # text features are a cache lookup and a sparse product with the selected columns
+        hashed = text.vectorize(df.index.tolist(), descriptions.tolist(), cache=text.get_cache())
 
-            if df_adapted[column].isnull().any():
-                print(column + ' with NaN')
-                df_adapted[column] = df_adapted[column].fillna(0)
+        # encoded with the training layout, independent of the other cars in the chunk
+        X = features.to_matrix(self.encoder.transform(df), self.equipment.transform(equipment), self.text.transform(hashed))
+
+        prices_inferred = self.regressor.predict(self.to_input(X)).astype(int)
+        differences = prices_actual - prices_inferred
 
         predictions = []
-        for index, row in df_adapted.iterrows():
-            car_row = numpy.asarray(row[self.columns])
-            # print(car_row)
-
-            try:
-                price_inferred = int(self.regressor.predict(numpy.asarray([car_row])))
-                price_actual = df.ix[index].price
-                difference = price_actual - price_inferred
-                is_cheap = difference < 0
-
-                price_prediction = {
-                    'price': {
-                        'actual': int(price_actual),
-                        'inferred': int(price_inferred),
-                        'difference': int(difference),
-                        'is_cheap': is_cheap,
-                    },
-                    'car_id': index,
-                }
-                predictions.append(price_prediction)
-            except:
-                logging.exception('price inferring went wrong')
-                print(df.ix[index].price)
-                print(type(df.ix[index].price))
-                # id
-                # 247503007    9600
-                # 247503007    9600
-                # Name: price, dtype: int64
-                # <class 'pandas.core.series.Series'>
+        for car_id, price_actual, price_inferred, difference in zip(df.index.tolist(), prices_actual.tolist(), prices_inferred.tolist(), differences.tolist()):
+            predictions.append({
+                'price': {
+                    'actual': price_actual,
+                    'inferred': price_inferred,
+                    'difference': difference,
+                    'is_cheap': difference < 0,
+                },
+                'car_id': car_id,
+            })
 
         return predictions
 
+    @instrumentation.timed('train')
     def train(self, cars, cross_validate=True):
-        df = prediction.preprocess(cars)
-        df_clean = self.prepare(df)
-
-        self.columns = list(df_clean.columns[1:])
-        # print('included: %s' % columns_training)
-        excluded = [column for column in list(df_clean.columns) if column not in self.columns]
-        # print('excluded: %s' % excluded)
-
-        X = df_clean[self.columns]
-        y = df_clean['price']
+        X, y = self.prepare_training_data(cars)
 
-        print('training')
-        # self.regressor = DecisionTreeRegressor(criterion='mae', min_samples_leaf=100, min_impurity_split=1000)  # 86%
-        # self.regressor = DecisionTreeRegressor(criterion='mae', min_samples_leaf=50, min_impurity_split=750)  # 87%
-        self.regressor = DecisionTreeRegressor(criterion='mae', min_samples_leaf=50)  # 87%
-        self.regressor.fit(X, y)
+        logging.info('training on %d cars' % X.shape[0])
+        X_input = self.to_input(X)
+        self.regressor = create_regressor(self.backend)
+        self.regressor.fit(X_input, y)
 
-        print("R² on training set:", self.regressor.score(X, y))
+        logging.info('R² on training set: %0.4f' % self.regressor.score(X_input, y))
         if cross_validate:
-            scores = cross_val_score(self.regressor, X, y)
-            print("Cross-validated Accuracy: %0.4f (+/- %0.4f)" % (scores.mean(), scores.std() * 2))
+            scores = self.cross_validate(X, y)
+            logging.info('Cross-validated Accuracy: %0.4f (+/- %0.4f)' % (scores.mean(), scores.std() * 2))
         else:
             logging.info('Skipping cross validation')
 
-    def prepare(self, df):
-        df_clean = pandas.DataFrame()
-        for column in list(df.columns.values):
-            print(column)
-            if df[column].dtype not in [numpy.float64, numpy.int]:
-                # create dummies and concat
-                dummies = pandas.get_dummies(df[column], prefix=column, dummy_na=True)
-                df_clean = pandas.concat([df_clean, dummies], axis=1)
-                print('  getting dummies (%d columns)' % len(list(dummies.columns)))
-            else:
-                print('  appending')
-                # copy column
-                if df[column].isnull().any():
-                    # nan_replacement = nan_replacements[column]
-                    df_clean[column] = df[column].fillna(df[column].mean())  # replace with mean
-                else:
-                    df_clean[column] = df[column]
-
-            # remove processed column to save memory
-            del df[column]
-        return df_clean
+    def cross_validate(self, X, y, scoring=None):
+        from sklearn.model_selection import cross_val_score
+
+        regressor = create_regressor(self.backend)
+        return cross_val_score(regressor, self.to_input(X), y, cv=CROSS_VALIDATION_FOLDS, scoring=scoring, n_jobs=CROSS_VALIDATION_JOBS)
+
+    def to_input(self, X):
+        if self.backend in DENSE_BACKENDS:
+            return X.toarray()
+        return X
+
+    def prepare_training_data(self, cars):
+        df = prediction.preprocess(cars, history=self.history)
+        self.fingerprint = prediction.get_fingerprint(df)
+        equipment = df.pop('features')
+        descriptions = df.pop('description')
+        y = df.pop('price')
+
+        # categories and fill-in means are learned here once, predict reuses them
+        self.encoder = FrameEncoder().fit(df)
+
+        # equipment goes straight into a sparse block with a vocabulary kept for predict
+        self.equipment = EquipmentVocabulary().fit(equipment)
+
+        # descriptions are hashed once per ad and version, only the selection runs on every train
+        hashed = text.vectorize(df.index.tolist(), descriptions.tolist(), cache=text.get_cache())
+        self.text = TextFeatures().fit(hashed, y)
+
+        X = features.to_matrix(self.encoder.transform(df), self.equipment.transform(equipment), self.text.transform(hashed))
+        return X, y
+
+    def get_feature_names(self):
+        return self.encoder.columns + self.equipment.get_column_names() + self.text.get_column_names()
+
+    def update_statistics(self, cars):
+        # fold new cars into the running fill-in means without refitting
+        df = prediction.preprocess(cars, history=self.history)
+        del df['features']
+        del df['description']
+        del df['price']
+        self.encoder.update(df)
+
+    def save(self, path):
+        model = {
+            'version': MODEL_FORMAT_VERSION,
+            'created_at': str(datetime.now()),
+            'fingerprint': self.fingerprint,
+            'backend': self.backend,
+            'regressor': self.regressor,
+            'encoder': self.encoder,
+            'equipment': self.equipment,
+            'text': self.text,
+        }
+        joblib.dump(model, path)
+        logging.info('saved model to %s' % path)
+
+    @classmethod
+    def load(cls, path):
+        model = joblib.load(path)
+        if model['version'] != MODEL_FORMAT_VERSION:
+            raise RuntimeError('model format %s is not supported, retrain the model' % model['version'])
+
+        predictor = cls(backend=model.get('backend', DEFAULT_BACKEND))
+        predictor.fingerprint = model['fingerprint']
+        predictor.regressor = model['regressor']
+        predictor.encoder = model['encoder']
+        predictor.equipment = model['equipment']
+        predictor.text = model['text']
+        logging.info('loaded model trained on %s' % predictor.fingerprint)
+        return predictor
@@ -0,0 +1,50 @@
+import json
+import logging
+import sys
+import time
+
+import scraping
+
+# cars listed this much (or more) below their inferred price are emitted
+DIFFERENCE_THRESHOLD = -1000
+
+
+def stream_deals(predictor, parameters=scraping.SEARCH_PREDICTION, threshold=DIFFERENCE_THRESHOLD, sink=None, pages=50, ad_ids=None):
+    # score every car as soon as it is extracted and emit deals right away
+    if sink is None:
+        sink = sys.stdout
+
+    start = time.perf_counter()
+    time_to_first_alert = None
+    scored = 0
+    alerts = 0
+
+    for car in scraping.iter_search(parameters, pages=pages, ad_ids=ad_ids):
+        for price_prediction in predictor.predict([car]):
+            scored += 1
+            if price_prediction['price']['difference'] > threshold:
+                continue
+
+            elapsed = time.perf_counter() - start
+            if time_to_first_alert is None:
+                time_to_first_alert = elapsed
+                logging.info('time to first alert: %.1fs' % time_to_first_alert)
+
+            alerts += 1
+            deal = {
+                'car_id': price_prediction['car_id'],
+                'url': car['url'],
+                'price': price_prediction['price'],
+                'seconds_since_start': elapsed,
+            }
+            sink.write(json.dumps(deal) + '\n')
+            sink.flush()
+
+    report = {
+        'scored': scored,
+        'alerts': alerts,
+        'time_to_first_alert': time_to_first_alert,
+        'duration': time.perf_counter() - start,
+    }
+    logging.info('stream finished: %s' % report)
+    return report
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy
+import scipy.sparse
+from joblib import Parallel, delayed
+
+CACHE_PATH = os.getcwd() + '/text_features.sqlite'
+
+# hashed columns, collisions among the few selected n-grams are negligible at this size
+N_FEATURES = 2 ** 20
+
+# word n-grams, like the former tf-idf money words
+NGRAM_RANGE = (2, 5)
+
+# hashed columns kept as model features
+TOP = 10
+
+# candidates are the most frequent columns in at most this share of the descriptions
+CANDIDATES = 200
+MAX_DOCUMENT_SHARE = 0.75
+
+# mutual information is estimated on a sample of at most this many ads
+SELECTION_SAMPLE_SIZE = 20000
+
+# candidate columns per selection task, tasks run in a process pool, -1 uses all cores
+SELECTION_CHUNK_SIZE = 25
+SELECTION_JOBS = -1
+
+# ad ids per cache query
+CACHE_BATCH_SIZE = 500
+
+_cache = None
+_lock = threading.Lock()
+
+
+class TextCache(object):
+    # hashed n-gram vectors per ad, valid as long as the description hash matches
+    path = None
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS vectors (ad_id INTEGER PRIMARY KEY, description_hash TEXT, indices BLOB, data BLOB)'
+        )
+        self._connection.commit()
+
+    def get_many(self, ad_ids, description_hashes):
+        # ad id -> (indices, data) for ads whose description did not change
+        expected = dict(zip(ad_ids, description_hashes))
+        unique_ad_ids = list(expected)
+        vectors = {}
+        with self._lock:
+            for start in range(0, len(unique_ad_ids), CACHE_BATCH_SIZE):
+                batch = unique_ad_ids[start:start + CACHE_BATCH_SIZE]
+                rows = self._connection.execute(
+                    'SELECT ad_id, description_hash, indices, data FROM vectors WHERE ad_id IN (%s)' % ','.join('?' * len(batch)), batch
+                ).fetchall()
+                for ad_id, description_hash, indices, data in rows:
+                    if description_hash == expected[ad_id]:
+                        vectors[ad_id] = (numpy.frombuffer(indices, dtype=numpy.int32), numpy.frombuffer(data, dtype=numpy.float32))
+        return vectors
+
+    def put_many(self, entries):
+        # entries of (ad id, description hash, indices, data)
+        with self._lock:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO vectors (ad_id, description_hash, indices, data) VALUES (?, ?, ?, ?)',
+                [(ad_id, description_hash, indices.astype(numpy.int32).tobytes(), data.astype(numpy.float32).tobytes())
+                 for ad_id, description_hash, indices, data in entries],
+            )
+            self._connection.commit()
+
+
+class TextFeatures(object):
+    # hashed n-gram columns that tell most about the price, chosen once in train
+    columns = None
+    projection = None  # sparse N_FEATURES x len(columns) matrix, one 1 per selected column, csc keeps it small
+
+    def fit(self, X, y, top=TOP):
+        from sklearn.feature_selection import mutual_info_regression
+
+        # document frequencies narrow a million hashed columns down to a few candidates
+        document_counts = numpy.bincount(X.indices, minlength=N_FEATURES)
+        document_counts[document_counts > MAX_DOCUMENT_SHARE * X.shape[0]] = 0
+        candidates = numpy.argsort(-document_counts, kind='stable')[:CANDIDATES]
+        candidates = numpy.sort(candidates[document_counts[candidates] > 0])
+
+        y = numpy.asarray(y)
+        if X.shape[0] > SELECTION_SAMPLE_SIZE:
+            sample = numpy.sort(numpy.random.RandomState(0).choice(X.shape[0], SELECTION_SAMPLE_SIZE, replace=False))
+            X, y = X[sample], y[sample]
+
+        # scored on presence, weighted values would make every distinct weight its own class
+        X_candidates = X[:, candidates].tocsc()
+        X_candidates.data[:] = 1
+
+        # mutual information is computed per column, so chunks of candidates score independently
+        chunks = [(start, min(start + SELECTION_CHUNK_SIZE, len(candidates))) for start in range(0, len(candidates), SELECTION_CHUNK_SIZE)]
+        scores = Parallel(n_jobs=SELECTION_JOBS)(
+            delayed(mutual_info_regression)(X_candidates[:, start:end], y, random_state=0) for start, end in chunks
+        )
+        scores = numpy.concatenate(scores) if len(scores) > 0 else numpy.array([])
+
+        self.columns = candidates[numpy.argsort(-scores, kind='stable')[:top]]
+        self.projection = scipy.sparse.csc_matrix(
+            (numpy.ones(len(self.columns), dtype=numpy.float32), (self.columns, numpy.arange(len(self.columns)))),
+            shape=(N_FEATURES, len(self.columns)),
+        )
+        return self
+
+    def transform(self, X):
+        return X @ self.projection
+
+    def get_column_names(self):
+        return ['text_%d' % column for column in self.columns]
+
+
+def vectorize(ad_ids, texts, cache=None):
+    # csr matrix of hashed n-grams, one row per ad, only uncached descriptions are tokenized
+    description_hashes = [get_description_hash(text) for text in texts]
+    cached = cache.get_many(ad_ids, description_hashes) if cache is not None else {}
+    rows = [cached.get(ad_id) for ad_id in ad_ids]
+
+    missing = [position for position, row in enumerate(rows) if row is None]
+    if len(missing) > 0:
+        hashed = create_vectorizer().transform([texts[position] for position in missing])
+        entries = []
+        for row_number, position in enumerate(missing):
+            start, end = hashed.indptr[row_number], hashed.indptr[row_number + 1]
+            rows[position] = (hashed.indices[start:end], hashed.data[start:end])
+            entries.append((ad_ids[position], description_hashes[position]) + rows[position])
+        if cache is not None:
+            cache.put_many(entries)
+
+    lengths = [len(indices) for indices, _ in rows]
+    indptr = numpy.concatenate([[0], numpy.cumsum(lengths)]).astype(numpy.int64)
+    indices = numpy.concatenate([indices for indices, _ in rows]) if len(rows) > 0 else numpy.array([], dtype=numpy.int32)
+    data = numpy.concatenate([data for _, data in rows]) if len(rows) > 0 else numpy.array([], dtype=numpy.float32)
+    return scipy.sparse.csr_matrix((data.astype(numpy.float32), indices, indptr), shape=(len(rows), N_FEATURES))
+
+
+def create_vectorizer():
+    # imported here, see benchmarks.startup
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    return HashingVectorizer(n_features=N_FEATURES, ngram_range=NGRAM_RANGE, alternate_sign=False, norm='l2', dtype=numpy.float32)
+
+
+def get_description_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def get_cache():
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = TextCache(CACHE_PATH)
+        return _cache
+
+
+def set_cache(cache):
+    global _cache
+    with _lock:
+        _cache = cache
@@ -1,21 +1,51 @@
 import logging
+import os
+import threading
 import urllib
-from datetime import datetime
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import monotonic
 
 import requests
 from bs4 import BeautifulSoup
 
+import instrumentation
 import storage
 from scraping import extraction
-
+from scraping.cache import SeenCache
+from scraping.client import HttpClient
+from scraping.liveness import LivenessChecker
+from scraping.scheduler import Scheduler, SearchJob
+from scraping.throttling import RateLimiter
+from scraping.watermarks import HighWaterMarks
+
+# ads seen within this time are not fetched again
 MAX_AGE_IN_MINUTES = 6 * 60
 
+# maximum number of ad ids kept in the seen-ad cache
 RESET_IDS_INTERVAL = 10000
 
-SLEEP_BEFORE_AD = 1
+SEEN_CACHE_PATH = os.getcwd() + '/seen_ads.bin'
+
+HIGH_WATER_MARKS_PATH = os.getcwd() + '/high_water_marks.json'
+
+LIVENESS_PATH = os.getcwd() + '/liveness.json'
+
+# online checks of ads are trusted for this time
+LIVENESS_TTL_IN_MINUTES = 60
+
+# liveness checks are bodiless HEAD requests with their own budget, the scraper budget below would cap them at 1/s
+LIVENESS_REQUESTS_PER_SECOND_PER_HOST = 10
+
+LIVENESS_MAX_WORKERS = 8
+
+# global politeness budget, shared by all workers
+REQUESTS_PER_SECOND_PER_HOST = 1
 
-SLEEP_BEFORE_RESULTS_PAGE = 5
+MAX_WORKERS = 4
+
+# searches running at the same time, they share the rate limit above
+MAX_PARALLEL_SEARCHES = 2
 
 USED_CARS = {
     'ambitCountry': 'DE',
@@ -66,115 +96,312 @@ PARAMETERS_TO_SCRAPE = [
     USED_PRIVATE_PREMIUM_CARS,
 ]
 
+# name, parameters, seconds between runs, priority (lower first)
+SEARCH_JOBS = [
+    ('used_private_premium_cars', USED_PRIVATE_PREMIUM_CARS, 5 * 60, 0),
+    ('used_cars', USED_CARS, 60 * 60, 1),
+]
+
+# overridable to point the scraper at a local stand-in server
+BASE_URL = 'https://suchen.mobile.de'
+
+rate_limiter = RateLimiter(REQUESTS_PER_SECOND_PER_HOST)
+
+liveness_rate_limiter = RateLimiter(LIVENESS_REQUESTS_PER_SECOND_PER_HOST)
+
+_client = None
+_liveness_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    # one scraper-wide client so connections are kept alive across pages and ads
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient(pool_size=MAX_WORKERS * MAX_PARALLEL_SEARCHES, rate_limiter=rate_limiter)
+        return _client
+
+
+def get_liveness_client():
+    # separate connections and pacing, checks do not queue behind ad pages
+    global _liveness_client
+    with _client_lock:
+        if _liveness_client is None:
+            _liveness_client = HttpClient(pool_size=LIVENESS_MAX_WORKERS, rate_limiter=liveness_rate_limiter)
+        return _liveness_client
+
 
 def run():
-    ad_ids = {}
-    while True:
-        for parameters in PARAMETERS_TO_SCRAPE:
-            scrape_search(parameters, ad_ids=ad_ids)
+    # persisted so a restart does not refetch everything
+    ad_ids = load_seen_cache()
+    watermarks = HighWaterMarks(HIGH_WATER_MARKS_PATH)
+
+    jobs = [SearchJob(name, parameters, interval, priority) for name, parameters, interval, priority in SEARCH_JOBS]
+    scheduler = Scheduler(
+        jobs,
+        lambda parameters: iter_search(parameters, ad_ids=ad_ids, watermarks=watermarks),
+        max_parallel=MAX_PARALLEL_SEARCHES,
+        on_finished=lambda job: ad_ids.save(SEEN_CACHE_PATH),
+    )
+    scheduler.run()
+
+
+def report_connection_stats():
+    # socket reuse of the shared client, logged and exported with the metrics
+    for host, host_stats in get_client().get_connection_stats().items():
+        logging.info('%s: %d requests on %d connections, reuse ratio %.2f' % (
+            host, host_stats['requests'], host_stats['connections'], host_stats['reuse_ratio']))
+        instrumentation.set_gauge('http_requests', host_stats['requests'], host=host)
+        instrumentation.set_gauge('http_connections', host_stats['connections'], host=host)
+        instrumentation.set_gauge('http_connection_reuse_ratio', host_stats['reuse_ratio'], host=host)
+
+
+def create_seen_cache():
+    return SeenCache(RESET_IDS_INTERVAL, MAX_AGE_IN_MINUTES * 60)
+
+
+def load_seen_cache(path=SEEN_CACHE_PATH):
+    return SeenCache.load(path, RESET_IDS_INTERVAL, MAX_AGE_IN_MINUTES * 60)
 
-        if len(ad_ids) > 100000:
-            # reset if too big
-            ad_ids = set()
-            print('resetting cached ids')
 
+def create_liveness_checker(path=LIVENESS_PATH):
+    return LivenessChecker(get_liveness_client(), get_ad_url, path=path, ttl=LIVENESS_TTL_IN_MINUTES * 60, max_workers=LIVENESS_MAX_WORKERS)
 
-def scrape_search(parameters, pages=50, ad_ids=None):
+
+def scrape_search(parameters, pages=50, ad_ids=None, watermarks=None):
+    return list(iter_search(parameters, pages=pages, ad_ids=ad_ids, watermarks=watermarks))
+
+
+def iter_search(parameters, pages=50, ad_ids=None, watermarks=None):
+    # yields cars one by one as soon as they are extracted
+    # with watermarks, paging stops at the first page that only holds known ads
     if pages > 50:
         logging.warning('pages bigger than 50 do not yield new results')
 
     if ad_ids is None:
-        ad_ids = {}
+        ad_ids = create_seen_cache()
 
-    cars_data = []
-    for page in range(1, 1 + pages):
-        cars_in_results = scrape_search_results(page, parameters, ad_ids)
-        cars_data.extend(cars_in_results)
+    high_water_mark = watermarks.get(parameters) if watermarks is not None else None
+    newest_ad_id = None
+    pages_crawled = 0
+    start = monotonic()
 
-    return cars_data
+    for page in range(1, 1 + pages):
+        page_ad_ids, new_ad_ids = yield from iter_search_results(page, parameters, ad_ids)
+        pages_crawled += 1
+        if len(page_ad_ids) > 0:
+            newest_ad_id = max(page_ad_ids) if newest_ad_id is None else max(newest_ad_id, max(page_ad_ids))
+
+        if watermarks is not None:
+            unknown = [ad_id for ad_id in new_ad_ids if high_water_mark is None or ad_id > high_water_mark]
+            if len(page_ad_ids) == 0 or len(unknown) == 0:
+                break
+
+    duration = monotonic() - start
+    stats = {
+        'pages_crawled': pages_crawled,
+        'pages_saved': pages - pages_crawled,
+        'seconds': duration,
+        'seconds_saved': (pages - pages_crawled) * duration / pages_crawled if pages_crawled > 0 else 0.0,
+    }
+
+    if watermarks is not None:
+        if newest_ad_id is not None:
+            watermarks.update(parameters, newest_ad_id)
+            watermarks.save()
+        logging.info('sweep crawled %d pages, saved %d pages and about %.0fs' % (stats['pages_crawled'], stats['pages_saved'], stats['seconds_saved']))
+
+    report_connection_stats()
+    return stats
 
 
 def scrape_search_results(page, parameters, ad_ids):
-    search_url = 'https://suchen.mobile.de/fahrzeuge/search.html'
-    parameters['pageNumber'] = page
-    url = search_url + '?' + urllib.parse.urlencode(parameters)
-    print(url)
+    return list(iter_search_results(page, parameters, ad_ids))
+
 
-    sleep(SLEEP_BEFORE_RESULTS_PAGE)
-    session = requests.session()
-    response = session.get(url)
+def iter_search_results(page, parameters, ad_ids):
+    # yields the cars of one results page, returns all and new ad ids on it
+    search_url = BASE_URL + '/fahrzeuge/search.html'
+    page_parameters = dict(parameters, pageNumber=page)  # shared search definitions stay untouched
+    url = search_url + '?' + urllib.parse.urlencode(page_parameters)
+    logging.info(url)
+
+    # paced by the shared per-host rate limit, like the ad pages
+    client = get_client()
+    with instrumentation.timer('http_fetch_results_page'):
+        response = client.get(url)
 
     html = response.content.decode('utf-8')
     soup = BeautifulSoup(html, 'html.parser')
 
     car_results = soup.find_all('div', {'class': 'cBox-body--resultitem'})
 
-    cars_data = []
+    page_ad_ids = []
+    new_ad_ids = []
     for car_result in car_results:
         car_link = car_result.a
         if car_link.has_attr('data-ad-id'):
             ad_id = int(car_result.a['data-ad-id'])
-            print(get_ad_url(ad_id))
-
-            if ad_id not in ad_ids:
-                # scrape again
-                car_data = None
-
-                # fetch from storage
-                if storage.is_stored(ad_id):
-                    print('  found in storage')
-                    html = storage.load_ad(ad_id)
-                    car_data = extract_data_from_ad(html, get_ad_url(ad_id))
-
-                # if storage is corrupt or non-existent
-                if car_data is None:
-                    print('  scraping')
-                    sleep(SLEEP_BEFORE_AD)  # sleep to keep footprint low
-                    car_data = scrape_ad(ad_id, session)
-
-                if car_data is not None:
-                    print('  done')
-                    ad_ids[ad_id] = datetime.now()
-                    cars_data.append(car_data)
+            logging.debug(get_ad_url(ad_id))
+            page_ad_ids.append(ad_id)
+
+            if ad_id not in ad_ids and ad_id not in new_ad_ids:
+                new_ad_ids.append(ad_id)
         else:
             logging.warning('no ad-id: %s' % car_result)
 
-    return cars_data
+    # fetch ads concurrently, map keeps the order of the results page
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = executor.map(lambda ad_id: fetch_ad(ad_id, client), new_ad_ids)
+
+        for ad_id, car_data in zip(new_ad_ids, results):
+            if car_data is not None:
+                logging.debug('done: %d' % ad_id)
+                ad_ids.add(ad_id)
+                yield car_data
+
+    return page_ad_ids, new_ad_ids
+
+
+def fetch_ad(ad_id, client=None):
+    # stored pages are served as they are until they are due for a check with the server
+    metadata = storage.get_metadata(ad_id)
+    html = None
+    if metadata is None and storage.is_stored(ad_id):
+        # stored before metadata was kept, the page may have been deleted since it was listed
+        html = storage.load_ad(ad_id)
+        if html is not None:
+            metadata = storage.seed_metadata(ad_id, html)
 
+    if metadata is not None and not is_due(metadata) and storage.is_stored(ad_id):
+        storage.touch_ad(ad_id)
+        car_data = load_car(ad_id, storage.get_metadata(ad_id), html)
+        if car_data is not None:
+            logging.debug('found in storage: %d' % ad_id)
+            instrumentation.increment('ads_from_storage')
+            return car_data
 
-def scrape_ad(ad_id, session=None):
-    if session is None:
-        session = requests.session()
+    # if due, or storage is corrupt or non-existent
+    logging.debug('scraping: %d' % ad_id)
+    instrumentation.increment('ads_scraped')
+    return scrape_ad(ad_id, client)
+
+
+def is_due(metadata):
+    # True if the server was not asked about the ad within MAX_AGE_IN_MINUTES
+    checked_at = metadata['checked_at'] or metadata['updated_at']
+    if checked_at is None:
+        return True
+    return datetime.now() - datetime.fromisoformat(checked_at) > timedelta(minutes=MAX_AGE_IN_MINUTES)
+
+
+def scrape_ad(ad_id, client=None):
+    # returns None if the page failed, an unchanged page gives the stored car with only last_seen_at bumped
+    if client is None:
+        client = get_client()
 
     # todo save pictures
 
+    # conditional request if the page was fetched and stored before
+    headers = {}
+    metadata = storage.get_metadata(ad_id)
+    if metadata is not None and storage.is_stored(ad_id):
+        if metadata['etag'] is not None:
+            headers['If-None-Match'] = metadata['etag']
+        if metadata['last_modified'] is not None:
+            headers['If-Modified-Since'] = metadata['last_modified']
+
     url = get_ad_url(ad_id)
-    response = session.get(url)
-    if response.status_code != 200:
-        logging.warning('status code is %d for %s' % (response.status_code, url))
+    try:
+        with instrumentation.timer('http_fetch_ad'):
+            response = client.get(url, headers=headers)
+    except requests.RequestException as exception:
+        logging.warning('request failed for %s: %s' % (url, exception))
+        instrumentation.increment('ads_failed')
         return None
-
-    html = response.content.decode('utf-8')
-    storage.save_ad(ad_id, html)
-
-    return extract_data_from_ad(html, url)
+    if response.status_code == 304 and len(headers) > 0:
+        logging.debug('not modified: %s' % url)
+        instrumentation.increment('ads_not_modified')
+        storage.touch_ad(ad_id, checked=True)
+        car_data = load_car(ad_id, storage.get_metadata(ad_id))
+    else:
+        if response.status_code != 200:
+            logging.warning('status code is %d for %s' % (response.status_code, url))
+            instrumentation.increment('ads_failed')
+            return None
+
+        html = response.content.decode('utf-8')
+        changed = storage.save_ad(ad_id, html, etag=response.headers.get('ETag'), last_modified=response.headers.get('Last-Modified'))
+        if not changed:
+            logging.debug('content unchanged: %s' % url)
+            instrumentation.increment('ads_unchanged')
+        elif metadata is not None:
+            instrumentation.increment('ads_changed')
+        car_data = load_car(ad_id, storage.get_metadata(ad_id), html)
+
+    if car_data is not None:
+        record_observation(car_data)
+    return car_data
+
+
+def load_car(ad_id, metadata, html=None):
+    # car of the stored content, extracted once per content hash, html is loaded from storage if needed
+    car = storage.get_car(ad_id, metadata['content_hash'])
+    if car is not None:
+        instrumentation.increment('ads_extraction_skipped')
+    else:
+        if html is None:
+            html = storage.load_ad(ad_id)
+            if html is None:
+                return None
+        car = extract_data_from_ad(html, get_ad_url(ad_id))
+        if car is None:
+            return None
+        storage.save_car(ad_id, metadata['content_hash'], car)
+    return set_metadata(car, metadata)
+
+
+def record_observation(car):
+    # price history of what the server answered, versions are told apart by the stored content hash
+    ad_id = car['mobile']['ad_id']
+    price = int(car['mobile']['dart']['ad']['price'])
+    mileage = None
+    mileage_raw = car['mobile']['web']['technical'].get('mileage')
+    if mileage_raw is not None:
+        digits = ''.join(character for character in mileage_raw if character.isdigit())
+        mileage = int(digits) if len(digits) > 0 else None
+    storage.record_observation(ad_id, storage.get_metadata(ad_id)['content_hash'], price, mileage)
 
 
 def get_ad_url(ad_id):
-    url = 'https://suchen.mobile.de/fahrzeuge/details.html?id=%d' % ad_id
+    url = BASE_URL + '/fahrzeuge/details.html?id=%d' % ad_id
     return url
 
 
-def extract_data_from_ad(html, url):
-    extractor = extraction.AdExtractor(html)
+def extract_data_from_ad(html, url, metadata=None):
+    extractor = extraction.get_extractor(html)
     car = extractor.get_data()
     if car is None:
         return None
 
+    # real crawler timestamps if the storage knows the ad
+    if metadata is not None:
+        set_metadata(car, metadata)
+
     # add url
     car['url'] = url
     return car
 
 
+def set_metadata(car, metadata):
+    car['crawler'] = {
+        'created_at': metadata['created_at'],
+        'updated_at': metadata['updated_at'],
+        'last_seen_at': metadata['last_seen_at'],
+    }
+    return car
+
+
 if __name__ == '__main__':
     run()
@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+from array import array
+
+
+# ad id of a free slot, also the end of a link
+EMPTY = -1
+
+
+class SeenCache(object):
+    # ids of recently handled ads with LRU eviction and expiry after max_age seconds
+    # max_size packed slots, the LRU order is a doubly linked list through the slots
+    __slots__ = ('max_size', 'max_age', '_ad_ids', '_added_ats', '_previous', '_next', '_free', '_slots', '_oldest', '_newest', '_lock')
+
+    def __init__(self, max_size, max_age):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._ad_ids = array('q', [EMPTY]) * max_size
+        self._added_ats = array('d', [0.0]) * max_size  # unix time the ad was added
+        self._previous = array('q', [EMPTY]) * max_size
+        self._next = array('q', [EMPTY]) * max_size
+        self._free = array('q', range(max_size - 1, -1, -1))  # free slots, popped from the end
+        self._slots = {}  # ad id -> slot
+        self._oldest = EMPTY
+        self._newest = EMPTY
+        self._lock = threading.Lock()
+
+    def __contains__(self, ad_id):
+        with self._lock:
+            slot = self._slots.get(ad_id)
+            if slot is None:
+                return False
+            if time.time() - self._added_ats[slot] > self.max_age:
+                self._remove(slot)
+                return False
+            self._unlink(slot)
+            self._link(slot)
+            return True
+
+    def __len__(self):
+        return len(self._slots)
+
+    def add(self, ad_id, added_at=None):
+        with self._lock:
+            slot = self._slots.get(ad_id)
+            if slot is not None:
+                self._unlink(slot)
+            else:
+                if len(self._free) == 0:
+                    self._remove(self._oldest)
+                slot = self._free.pop()
+                self._ad_ids[slot] = ad_id
+                self._slots[ad_id] = slot
+            self._added_ats[slot] = added_at if added_at is not None else time.time()
+            self._link(slot)
+
+    def expire(self):
+        with self._lock:
+            now = time.time()
+            expired = [slot for slot in self._slots.values() if now - self._added_ats[slot] > self.max_age]
+            for slot in expired:
+                self._remove(slot)
+        return len(expired)
+
+    def save(self, path):
+        # two packed arrays, in LRU order
+        ad_ids = array('q')
+        added_ats = array('d')
+        with self._lock:
+            slot = self._oldest
+            while slot != EMPTY:
+                ad_ids.append(self._ad_ids[slot])
+                added_ats.append(self._added_ats[slot])
+                slot = self._next[slot]
+        temporary_path = '%s.%d.tmp' % (path, threading.get_ident())  # concurrent saves must not share a file
+        with open(temporary_path, 'wb') as file:
+            array('q', [len(ad_ids)]).tofile(file)
+            ad_ids.tofile(file)
+            added_ats.tofile(file)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path, max_size, max_age):
+        cache = cls(max_size, max_age)
+        if not os.path.exists(path):
+            return cache
+
+        with open(path, 'rb') as file:
+            count = array('q')
+            count.fromfile(file, 1)
+            ad_ids = array('q')
+            ad_ids.fromfile(file, count[0])
+            added_ats = array('d')
+            added_ats.fromfile(file, count[0])
+
+        for ad_id, added_at in zip(ad_ids, added_ats):
+            cache.add(ad_id, added_at)
+        cache.expire()
+        return cache
+
+    def _link(self, slot):
+        # as the newest entry
+        self._previous[slot] = self._newest
+        self._next[slot] = EMPTY
+        if self._newest != EMPTY:
+            self._next[self._newest] = slot
+        else:
+            self._oldest = slot
+        self._newest = slot
+
+    def _unlink(self, slot):
+        previous_slot, next_slot = self._previous[slot], self._next[slot]
+        if previous_slot != EMPTY:
+            self._next[previous_slot] = next_slot
+        else:
+            self._oldest = next_slot
+        if next_slot != EMPTY:
+            self._previous[next_slot] = previous_slot
+        else:
+            self._newest = previous_slot
+
+    def _remove(self, slot):
+        self._unlink(slot)
+        del self._slots[self._ad_ids[slot]]
+        self._ad_ids[slot] = EMPTY
+        self._free.append(slot)
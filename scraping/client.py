@@ -0,0 +1,134 @@
+import logging
+import random
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+# seconds to connect and between two received bytes, a stalled socket must not hold a pooled connection forever
+TIMEOUT = 30
+
+
+class HttpClient(object):
+    session = None
+    rate_limiter = None
+    max_retries = None
+    backoff_base = None
+    backoff_max = None
+    timeout = None
+
+    def __init__(self, pool_size=10, rate_limiter=None, max_retries=5, backoff_base=1.0, backoff_max=60.0, timeout=TIMEOUT):
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        # one keep-alive pool per host, big enough for all workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self._requests_per_host = {}
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.wait(url)
+
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as exception:
+                # timeouts and dropped connections are retried like server errors
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._get_backoff(attempt)
+                logging.warning('%s for %s, retrying in %.1fs' % (exception.__class__.__name__, url, delay))
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._count_request(url)
+
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                return response
+
+            delay = self._get_delay(response, attempt)
+            logging.warning('status code is %d for %s, retrying in %.1fs' % (response.status_code, url, delay))
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def get_connection_stats(self):
+        # sockets opened vs. requests sent per host, taken from the urllib3 pools
+        stats = {}
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                if pool is None:
+                    continue
+                host = '%s:%s' % (pool.host, pool.port)
+                host_stats = stats.setdefault(host, {'connections': 0, 'requests': 0})
+                host_stats['connections'] += pool.num_connections
+                host_stats['requests'] += pool.num_requests
+
+        with self._lock:
+            for host, count in self._requests_per_host.items():
+                stats.setdefault(host, {'connections': 0, 'requests': 0})['client_requests'] = count
+
+        for host_stats in stats.values():
+            requests_sent = host_stats['requests']
+            host_stats['reuse_ratio'] = 1 - host_stats['connections'] / requests_sent if requests_sent else 0.0
+        return stats
+
+    def close(self):
+        self.session.close()
+
+    def _count_request(self, url):
+        parts = urllib.parse.urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        host = '%s:%s' % (parts.hostname, port)
+        with self._lock:
+            self._requests_per_host[host] = self._requests_per_host.get(host, 0) + 1
+
+    def _get_delay(self, response, attempt):
+        retry_after = get_retry_after(response)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return self._get_backoff(attempt)
+
+    def _get_backoff(self, attempt):
+        # exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+def get_retry_after(response):
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+
+    if value.strip().isdigit():
+        return float(value)
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        logging.warning('invalid Retry-After header: %s' % value)
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
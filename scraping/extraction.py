@@ -1,9 +1,20 @@
 import json
 import logging
+import re
 from datetime import datetime
 
 from bs4 import BeautifulSoup
 
+import instrumentation
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+# bs4 keeps whitespace-only strings as a single newline or space
+WHITESPACE_ONLY = re.compile(r'^[ \n\t\f\r]+$')
+
 
 class AdExtractor(object):
     html = None
@@ -11,6 +22,7 @@ class AdExtractor(object):
     def __init__(self, html):
         self.html = html
 
+    @instrumentation.timed('extraction_get_data')
     def get_data(self):
         car = self.scrape_data_from_ad_page()
 
@@ -103,22 +115,128 @@ class AdExtractor(object):
                 'text': description_text,
             }
 
-        car = {
-            'crawler': {
-                'created_at': str(datetime.now()),
-                'updated_at': str(datetime.now()),
-                'last_seen_at': str(datetime.now()),
-            },
-            'mobile': {
-                'ad_id': ad_id,
-                'web': {
-                    'title': title,
-                    'price': price,
-                    'technical': technical_data,
-                    'features': features,
-                    'description': description,
-                    'seller': seller,
-                }
-            },
+        return build_car(title, price, ad_id, seller, technical_data, features, description)
+
+
+class LxmlAdExtractor(AdExtractor):
+    # same output as AdExtractor, but parses the page once with lxml and skips the bs4 tree
+
+    def scrape_data_from_ad_page(self):
+        root = lxml.html.fromstring(self.html)
+
+        # generic
+        title = get_text(_find(root, '//h1[@id="rbt-ad-title"]'))
+        price = get_text(_find(root, '//span[%s]' % _has_class('rbt-prime-price')))
+
+        ad_id = int(_find(root, '//div[%s]' % _has_class('parking-block')).get('data-parking'))
+
+        # seller
+        seller_address = get_text(_find(root, '//p[@id="rbt-seller-address"]'), separator=' ')
+
+        seller_phone = None
+        seller_phone_tag = _find(root, '//span[@id="rbt-seller-phone"]')
+        if seller_phone_tag is not None:
+            seller_phone = get_text(seller_phone_tag).replace('Tel.: ', '')
+
+        seller = {
+            'address': seller_address,
+            'phone': seller_phone,
         }
-        return car
+
+        # technical data, rows hold elements only, the reference fails on text between them
+        technical_data = {}
+        for child in root.xpath('//div[@id="rbt-td-box"]//div[%s]/*' % _has_class('g-row')):
+            id = child.get('id')
+            key = id.replace('-l', '').replace('-v', '').replace('rbt-', '')
+            if '-v' in id:
+                technical_data[key] = get_text(child)
+
+        # features
+        features = None
+        features_box_tag = _find(root, '//div[@id="rbt-features"]')
+        if features_box_tag is not None:
+            features_row = _find(features_box_tag, './/div[%s]' % _has_class('g-row'))
+            features = [get_text(column) for column in _iter_children(features_row)]
+
+        # description
+        description = None
+        description_box = _find(root, '//div[%s]//div[%s]' % (_has_class('cBox-body--vehicledescription'), _has_class('description')))
+        if description_box is not None:
+            description = {
+                'html': lxml.html.tostring(description_box, encoding='unicode', with_tail=False),
+                'text': get_text(description_box, separator='\n'),
+            }
+
+        return build_car(title, price, ad_id, seller, technical_data, features, description)
+
+
+BACKENDS = {
+    'bs4': AdExtractor,
+    'lxml': LxmlAdExtractor,
+}
+
+DEFAULT_BACKEND = 'lxml' if lxml is not None else 'bs4'
+
+
+def get_extractor(html, backend=None):
+    if backend is None:
+        backend = DEFAULT_BACKEND
+    return BACKENDS[backend](html)
+
+
+def build_car(title, price, ad_id, seller, technical_data, features, description):
+    car = {
+        'crawler': {
+            'created_at': str(datetime.now()),
+            'updated_at': str(datetime.now()),
+            'last_seen_at': str(datetime.now()),
+        },
+        'mobile': {
+            'ad_id': ad_id,
+            'web': {
+                'title': title,
+                'price': price,
+                'technical': technical_data,
+                'features': features,
+                'description': description,
+                'seller': seller,
+            }
+        },
+    }
+    return car
+
+
+def get_text(element, separator=''):
+    # equivalent of bs4's get_text for lxml elements and strings
+    if isinstance(element, str):
+        return _collapse_whitespace(element)
+    if not isinstance(element.tag, str):
+        return ''  # comments
+    return separator.join(_collapse_whitespace(text) for text in element.itertext())
+
+
+def _collapse_whitespace(text):
+    if WHITESPACE_ONLY.match(text):
+        return '\n' if '\n' in text else ' '
+    return text
+
+
+def _iter_children(element):
+    # elements and the text between them, like bs4's children
+    if element.text:
+        yield element.text
+    for child in element:
+        yield child
+        if child.tail:
+            yield child.tail
+
+
+def _find(element, xpath):
+    results = element.xpath(xpath)
+    if len(results) == 0:
+        return None
+    return results[0]
+
+
+def _has_class(class_name):
+    return 'contains(concat(" ", normalize-space(@class), " "), " %s ")' % class_name
@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ALIVE_STATUS_CODES = [200, 206]
+
+DEAD_STATUS_CODES = [404, 410]
+
+# servers that refuse HEAD are asked for the first byte instead
+HEAD_NOT_ALLOWED_STATUS_CODES = [405, 501]
+
+
+class LivenessChecker(object):
+    # concurrent online checks of ads, results are cached for ttl seconds
+    client = None
+    get_url = None
+    path = None
+    ttl = None
+    max_workers = None
+
+    def __init__(self, client, get_url, path=None, ttl=60 * 60, max_workers=4):
+        self.client = client
+        self.get_url = get_url
+        self.path = path
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self._results = {}  # ad id -> (alive, unix time it was checked)
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            with open(path) as file:
+                self._results = {int(ad_id): tuple(result) for ad_id, result in json.load(file).items()}
+            self.expire()
+
+    def get_cached(self, ad_id):
+        with self._lock:
+            result = self._results.get(ad_id)
+        if result is None or time.time() - result[1] > self.ttl:
+            return None
+        return result[0]
+
+    def check(self, ad_ids):
+        # ad id -> alive, only ads without a fresh cached result are requested
+        results = {}
+        unchecked = []
+        for ad_id in ad_ids:
+            alive = self.get_cached(ad_id)
+            if alive is None:
+                unchecked.append(ad_id)
+            else:
+                results[ad_id] = alive
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for ad_id, alive in zip(unchecked, executor.map(self.is_alive, unchecked)):
+                results[ad_id] = alive is True
+                if alive is not None:
+                    with self._lock:
+                        self._results[ad_id] = (alive, time.time())
+        return results
+
+    def iterate_alive(self, ad_ids, batch_size=None):
+        # keeps the given order, checks batch by batch so callers can stop early
+        ad_ids = list(ad_ids)
+        batch_size = batch_size or self.max_workers * 4
+        for start in range(0, len(ad_ids), batch_size):
+            batch = ad_ids[start:start + batch_size]
+            results = self.check(batch)
+            for ad_id in batch:
+                if results[ad_id]:
+                    yield ad_id
+
+    def is_alive(self, ad_id):
+        # True or False, None if it could not be decided
+        url = self.get_url(ad_id)
+        try:
+            response = self.client.head(url, allow_redirects=True)
+            if response.status_code in HEAD_NOT_ALLOWED_STATUS_CODES:
+                response = self.client.get(url, headers={'Range': 'bytes=0-0'}, stream=True)
+                response.close()
+        except requests.RequestException as exception:
+            logging.warning('liveness check failed for %s: %s' % (url, exception))
+            return None
+
+        if response.status_code in ALIVE_STATUS_CODES:
+            return True
+        if response.status_code in DEAD_STATUS_CODES:
+            return False
+        logging.warning('liveness unknown, status code is %d for %s' % (response.status_code, url))
+        return None
+
+    def expire(self):
+        with self._lock:
+            now = time.time()
+            expired = [ad_id for ad_id, result in self._results.items() if now - result[1] > self.ttl]
+            for ad_id in expired:
+                del self._results[ad_id]
+        return len(expired)
+
+    def save(self):
+        if self.path is None:
+            return
+        self.expire()
+        with self._lock:
+            results = {str(ad_id): list(result) for ad_id, result in self._results.items()}
+        temporary_path = '%s.%d.tmp' % (self.path, threading.get_ident())
+        with open(temporary_path, 'w') as file:
+            json.dump(results, file)
+        os.replace(temporary_path, self.path)
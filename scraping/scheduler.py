@@ -0,0 +1,93 @@
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import monotonic, sleep
+
+
+class SearchJob(object):
+    name = None
+    parameters = None
+    interval = None
+    priority = None
+
+    def __init__(self, name, parameters, interval, priority=0):
+        self.name = name
+        self.parameters = parameters
+        self.interval = interval  # seconds between the end of a run and the next start
+        self.priority = priority  # lower runs first when several jobs are due
+        self.next_run_at = 0.0
+        self.runs = 0
+        self.cars = 0
+        self.seconds = 0.0
+        self.last_duration = None
+
+    def get_report(self):
+        return {
+            'name': self.name,
+            'runs': self.runs,
+            'cars': self.cars,
+            'last_latency': self.last_duration,
+            'average_latency': self.seconds / self.runs if self.runs > 0 else None,
+            'cars_per_second': self.cars / self.seconds if self.seconds > 0 else 0.0,
+        }
+
+
+class Scheduler(object):
+    # runs search jobs on their own intervals, sharing the seen-ad cache and the client's rate limiter
+    jobs = None
+    max_parallel = None
+
+    def __init__(self, jobs, search, max_parallel=2, on_finished=None):
+        self.jobs = jobs
+        self.search = search  # callable(parameters) returning a generator of cars
+        self.max_parallel = max_parallel
+        self.on_finished = on_finished
+        self._lock = threading.Lock()
+
+    def run(self, max_runs=None):
+        runs = 0
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            while max_runs is None or runs < max_runs or len(running) > 0:
+                now = monotonic()
+                due = [job for job in self.jobs if job not in running.values() and job.next_run_at <= now]
+                for job in sorted(due, key=lambda job: (job.priority, job.next_run_at)):
+                    if len(running) >= self.max_parallel or (max_runs is not None and runs >= max_runs):
+                        break
+                    running[executor.submit(self.run_job, job)] = job
+                    runs += 1
+
+                idle = [job for job in self.jobs if job not in running.values()]
+                timeout = max(0.0, min(job.next_run_at for job in idle) - monotonic()) if len(idle) > 0 else None
+                if len(running) == 0:
+                    sleep(timeout)
+                    continue
+
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+
+    def run_job(self, job):
+        start = monotonic()
+        cars = 0
+        try:
+            for _ in self.search(job.parameters):
+                cars += 1
+        except Exception:
+            logging.exception('search %s failed' % job.name)
+
+        duration = monotonic() - start
+        with self._lock:
+            job.runs += 1
+            job.cars += cars
+            job.seconds += duration
+            job.last_duration = duration
+            job.next_run_at = monotonic() + job.interval
+
+        logging.info('search %s: %d cars in %.1fs, %s' % (job.name, cars, duration, job.get_report()))
+        if self.on_finished is not None:
+            self.on_finished(job)
+
+    def get_report(self):
+        with self._lock:
+            return [job.get_report() for job in self.jobs]
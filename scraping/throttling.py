@@ -0,0 +1,24 @@
+import threading
+import time
+import urllib.parse
+
+
+class RateLimiter(object):
+    requests_per_second = None
+
+    def __init__(self, requests_per_second):
+        self.requests_per_second = requests_per_second
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, url):
+        # reserve the next free slot for this host, then sleep outside the lock
+        host = urllib.parse.urlsplit(url).netloc
+        interval = 1 / self.requests_per_second
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
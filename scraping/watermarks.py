@@ -0,0 +1,41 @@
+import json
+import os
+import threading
+import urllib.parse
+
+
+class HighWaterMarks(object):
+    # newest ad id seen per search, to stop paging once only known ads show up
+    path = None
+
+    def __init__(self, path=None):
+        self.path = path
+        self._marks = {}
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            with open(path) as file:
+                self._marks = json.load(file)
+
+    def get(self, parameters):
+        with self._lock:
+            return self._marks.get(get_search_key(parameters))
+
+    def update(self, parameters, ad_id):
+        key = get_search_key(parameters)
+        with self._lock:
+            if self._marks.get(key) is None or ad_id > self._marks[key]:
+                self._marks[key] = ad_id
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            marks = dict(self._marks)
+        temporary_path = '%s.%d.tmp' % (self.path, threading.get_ident())
+        with open(temporary_path, 'w') as file:
+            json.dump(marks, file)
+        os.replace(temporary_path, self.path)
+
+
+def get_search_key(parameters):
+    return urllib.parse.urlencode(sorted((key, value) for key, value in parameters.items() if key != 'pageNumber'))
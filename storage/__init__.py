@@ -1,35 +1,125 @@
-import boto3
+import hashlib
+import os
+import threading
+from datetime import datetime
 
-import config
+import instrumentation
+from storage import backends
+from storage.history import PriceHistory
+from storage.metadata import AdMetadata
 
-GENERIC_AD_PATH = 'mobile/ads/%d/%s.html'
+try:
+    import config
+except ImportError:
+    config = None  # offline runs like the benchmarks set their backend with set_backend
 
+INDEX_PATH = os.getcwd() + '/storage_index.sqlite'
 
-def _get_ad_key(ad_id):
-    filename = 'data'
-    return GENERIC_AD_PATH % (ad_id, filename)
+INDEX_REFRESH_INTERVAL = 60 * 60
 
+METADATA_PATH = os.getcwd() + '/ad_metadata.sqlite'
 
-def save_ad(ad_id, html):
-    object = _get_bucket().put_object(Key=_get_ad_key(ad_id), Body=html)
-    return True
+HISTORY_PATH = os.getcwd() + '/price_history.sqlite'
 
+_backend = None
+_metadata = None
+_history = None
+_lock = threading.Lock()
 
+
+@instrumentation.timed('storage_save_ad')
+def save_ad(ad_id, html, etag=None, last_modified=None):
+    # skips the upload and returns False if the content is unchanged
+    changed = get_metadata_store().record(ad_id, get_content_hash(html), etag=etag, last_modified=last_modified)
+    if changed or not is_stored(ad_id):
+        get_backend().save(ad_id, html)
+    return changed
+
+
+def get_content_hash(html):
+    return hashlib.sha1(html.encode('utf-8')).hexdigest()
+
+
+def get_metadata(ad_id):
+    return get_metadata_store().get(ad_id)
+
+
+def seed_metadata(ad_id, html):
+    # metadata of an ad stored without it, dated by the time the backend saved the page instead of now
+    saved_at = get_backend().get_saved_at(ad_id)
+    get_metadata_store().seed(ad_id, get_content_hash(html), str(datetime.fromtimestamp(saved_at)) if saved_at is not None else None)
+    return get_metadata(ad_id)
+
+
+def get_car(ad_id, content_hash):
+    return get_metadata_store().get_car(ad_id, content_hash)
+
+
+def save_car(ad_id, content_hash, car):
+    get_metadata_store().put_car(ad_id, content_hash, car)
+
+
+def touch_ad(ad_id, checked=False):
+    # ad was seen again without changes
+    get_metadata_store().touch(ad_id, checked=checked)
+
+
+@instrumentation.timed('storage_load_ad')
 def load_ad(ad_id):
-    s3_object = boto3.resource('s3').Object(config.S3_BUCKET_NAME, _get_ad_key(ad_id))
-    ad_html_bytes = s3_object.get()["Body"].read()
-    ad_html = ad_html_bytes.decode('utf-8')
-    return ad_html
+    return get_backend().load(ad_id)
 
 
+@instrumentation.timed('storage_is_stored')
 def is_stored(ad_id):
-    ad_key = _get_ad_key(ad_id)
-    objs = list(_get_bucket().objects.filter(Prefix=ad_key))
-    if len(objs) > 0 and objs[0].key == ad_key:
-        return True
-    return False
+    return get_backend().exists(ad_id)
+
+
+def iterate_ads(after_ad_id=None):
+    # (ad_id, html) by ascending id
+    return get_backend().iterate_ads(after_ad_id=after_ad_id)
+
+
+def get_backend():
+    global _backend
+    with _lock:
+        if _backend is None:
+            _backend = create_backend(getattr(config, 'STORAGE_BACKEND', 's3'))
+        return _backend
+
+
+def record_observation(ad_id, content_hash, price, mileage):
+    get_price_history().record(ad_id, content_hash, price, mileage)
+
+
+def get_price_history():
+    global _history
+    with _lock:
+        if _history is None:
+            _history = PriceHistory(HISTORY_PATH)
+        return _history
+
+
+def get_metadata_store():
+    global _metadata
+    with _lock:
+        if _metadata is None:
+            _metadata = AdMetadata(METADATA_PATH)
+        return _metadata
+
+
+def set_backend(backend):
+    global _backend
+    with _lock:
+        _backend = backend
 
 
-def _get_bucket():
-    s3 = boto3.resource('s3')
-    return s3.Bucket(config.S3_BUCKET_NAME)
+def create_backend(name):
+    if config is None:
+        raise RuntimeError('no config.py, set a backend with storage.set_backend')
+    if name == 's3':
+        return backends.S3Backend(config.S3_BUCKET_NAME, INDEX_PATH, index_refresh_interval=INDEX_REFRESH_INTERVAL)
+    if name == 'local':
+        return backends.LocalBackend(config.STORAGE_DIRECTORY)
+    if name == 'segments':
+        return backends.SegmentBackend(config.STORAGE_DIRECTORY)
+    raise ValueError('unknown storage backend: %s' % name)
@@ -0,0 +1,338 @@
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+
+from storage.index import StorageIndex
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GENERIC_AD_PATH = 'mobile/ads/%d/%s.html'
+
+
+def get_ad_key(ad_id):
+    filename = 'data'
+    return GENERIC_AD_PATH % (ad_id, filename)
+
+
+class Backend(object):
+
+    def save(self, ad_id, html):
+        raise NotImplementedError()
+
+    def load(self, ad_id):
+        # html of the ad, None if it is not stored
+        raise NotImplementedError()
+
+    def exists(self, ad_id):
+        raise NotImplementedError()
+
+    def get_saved_at(self, ad_id):
+        # unix time the page was last written, None if it is not stored
+        raise NotImplementedError()
+
+    def iterate(self):
+        # yields all stored ad ids
+        raise NotImplementedError()
+
+    def iterate_ads(self, after_ad_id=None):
+        # yields (ad_id, html) by ascending id, starting after after_ad_id, backends override this if they can read faster
+        for ad_id in sorted(self.iterate()):
+            if after_ad_id is not None and ad_id <= after_ad_id:
+                continue
+            html = self.load(ad_id)
+            if html is not None:
+                yield ad_id, html
+
+
+class S3Backend(Backend):
+    bucket_name = None
+    index = None
+
+    def __init__(self, bucket_name, index_path, index_refresh_interval=60 * 60):
+        self.bucket_name = bucket_name
+        self.index = StorageIndex(index_path, refresh_interval=index_refresh_interval)
+        # clients are thread-safe, unlike resources, and reuse their connections
+        import boto3  # imported here, scraper runs on local storage should not pay for it
+
+        self._client = boto3.client('s3')
+        self._refresh_lock = threading.Lock()
+        self._refresh_thread = None
+
+    def save(self, ad_id, html):
+        self._client.put_object(Bucket=self.bucket_name, Key=get_ad_key(ad_id), Body=html)
+        self.index.add(ad_id)
+
+    def load(self, ad_id):
+        try:
+            s3_object = self._client.get_object(Bucket=self.bucket_name, Key=get_ad_key(ad_id))
+        except self._client.exceptions.NoSuchKey:
+            # deleted since the index listed it
+            logging.warning('ad %d is in the storage index but not in the bucket' % ad_id)
+            self.index.remove(ad_id)
+            return None
+        ad_html_bytes = s3_object['Body'].read()
+        return ad_html_bytes.decode('utf-8')
+
+    def exists(self, ad_id):
+        self._refresh_if_stale()
+        return ad_id in self.index
+
+    def get_saved_at(self, ad_id):
+        saved_at = self.index.get_saved_at(ad_id)
+        if saved_at is not None:
+            return saved_at
+        try:
+            s3_object = self._client.head_object(Bucket=self.bucket_name, Key=get_ad_key(ad_id))
+        except self._client.exceptions.ClientError:
+            return None
+        return s3_object['LastModified'].timestamp()
+
+    def iterate(self):
+        self._refresh_if_stale()
+        return iter(self.index)
+
+    def refresh_index(self):
+        self.index.refresh(self._client, self.bucket_name)
+
+    def _refresh_if_stale(self):
+        # only the first listing blocks, later ones run in the background while the manifest keeps answering
+        if not self.index.is_stale():
+            return
+        with self._refresh_lock:
+            if not self.index.is_stale():  # another thread may have refreshed meanwhile
+                return
+            if not self.index.is_listed():
+                self.refresh_index()
+            elif self._refresh_thread is None or not self._refresh_thread.is_alive():
+                self._refresh_thread = threading.Thread(target=self._refresh_in_background, daemon=True)
+                self._refresh_thread.start()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh_index()
+        except Exception as e:
+            logging.warning('storage index refresh failed: %s' % e)
+
+
+class LocalBackend(Backend):
+    directory = None
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def save(self, ad_id, html):
+        path = self._get_path(ad_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(html)
+
+    def load(self, ad_id):
+        try:
+            with open(self._get_path(ad_id), encoding='utf-8') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, ad_id):
+        return os.path.isfile(self._get_path(ad_id))
+
+    def get_saved_at(self, ad_id):
+        try:
+            return os.path.getmtime(self._get_path(ad_id))
+        except FileNotFoundError:
+            return None
+
+    def iterate(self):
+        ads_directory = os.path.join(self.directory, 'mobile', 'ads')
+        if not os.path.isdir(ads_directory):
+            return
+        # sorted for a stable order across runs
+        ad_ids = sorted(int(entry.name) for entry in os.scandir(ads_directory) if entry.name.isdigit())
+        for ad_id in ad_ids:
+            if os.path.isfile(self._get_path(ad_id)):
+                yield ad_id
+
+    def _get_path(self, ad_id):
+        return os.path.join(self.directory, get_ad_key(ad_id))
+
+
+class SegmentBackend(Backend):
+    # append-only segment files of zstd-compressed pages with an offset index in sqlite
+    # pages are compressed with a dictionary trained on a sample of pages, so the markup shared by all ads is stored once
+    directory = None
+    segment_size = None
+    compression_level = None
+
+    # ad id and length of the compressed blob
+    RECORD_HEADER = struct.Struct('<qI')
+
+    # records per batch of iterate_ads, read sorted by position
+    READ_BATCH_SIZE = 4096
+
+    # pages the dictionary is trained on, and its size in bytes
+    DICTIONARY_SAMPLES = 200
+    DICTIONARY_SIZE = 112 * 1024
+
+    def __init__(self, directory, segment_size=256 * 1024 * 1024, compression_level=9):
+        if zstandard is None:
+            raise RuntimeError('the segment backend needs the zstandard package')
+
+        self.directory = directory
+        self.segment_size = segment_size
+        self.compression_level = compression_level
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._local = threading.local()  # compressors and decompressors are not thread-safe
+        self._connection = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS ads (ad_id INTEGER PRIMARY KEY, segment INTEGER, offset INTEGER, length INTEGER, saved_at REAL)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS segments (segment INTEGER PRIMARY KEY, dictionary_id INTEGER)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS dictionaries (dictionary_id INTEGER PRIMARY KEY, data BLOB)')
+        self._connection.commit()
+
+        row = self._connection.execute('SELECT MAX(segment) FROM ads').fetchone()
+        self._segment = row[0] if row[0] is not None else 0
+
+        # dictionary id -> zstd dictionary, segment -> dictionary id, None for pages compressed without one
+        self._dictionaries = {
+            dictionary_id: zstandard.ZstdCompressionDict(data)
+            for dictionary_id, data in self._connection.execute('SELECT dictionary_id, data FROM dictionaries')
+        }
+        self._segment_dictionaries = dict(self._connection.execute('SELECT segment, dictionary_id FROM segments'))
+        self._dictionary_id = max(self._dictionaries) if len(self._dictionaries) > 0 else None
+        self._samples = []
+
+    def save(self, ad_id, html):
+        data = html.encode('utf-8')
+        dictionary_id = self._dictionary_id
+        blob = self._get_compressor(dictionary_id).compress(data)
+
+        with self._lock:
+            if self._dictionary_id is None:
+                self._add_sample(data)
+
+            path = self._get_segment_path(self._segment)
+            if os.path.exists(path) and os.path.getsize(path) >= self.segment_size:
+                self._start_segment(self._segment + 1)
+                path = self._get_segment_path(self._segment)
+            elif self._segment not in self._segment_dictionaries:
+                self._start_segment(self._segment)
+
+            # a dictionary trained meanwhile starts a new segment
+            if dictionary_id != self._segment_dictionaries[self._segment]:
+                dictionary_id = self._segment_dictionaries[self._segment]
+                blob = self._get_compressor(dictionary_id).compress(data)
+
+            with open(path, 'ab') as file:
+                offset = file.tell() + self.RECORD_HEADER.size
+                file.write(self.RECORD_HEADER.pack(ad_id, len(blob)))
+                file.write(blob)
+
+            # later records for the same ad win
+            self._connection.execute(
+                'INSERT OR REPLACE INTO ads (ad_id, segment, offset, length, saved_at) VALUES (?, ?, ?, ?, ?)',
+                (ad_id, self._segment, offset, len(blob), time.time()),
+            )
+            self._connection.commit()
+
+    def load(self, ad_id):
+        with self._lock:
+            row = self._connection.execute('SELECT segment, offset, length FROM ads WHERE ad_id = ?', (ad_id,)).fetchone()
+        if row is None:
+            return None
+
+        segment, offset, length = row
+        with open(self._get_segment_path(segment), 'rb') as file:
+            file.seek(offset)
+            blob = file.read(length)
+        return self._decompress(blob, segment)
+
+    def exists(self, ad_id):
+        with self._lock:
+            row = self._connection.execute('SELECT 1 FROM ads WHERE ad_id = ?', (ad_id,)).fetchone()
+        return row is not None
+
+    def get_saved_at(self, ad_id):
+        with self._lock:
+            row = self._connection.execute('SELECT saved_at FROM ads WHERE ad_id = ?', (ad_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def iterate(self):
+        with self._lock:
+            rows = self._connection.execute('SELECT ad_id FROM ads ORDER BY segment, offset').fetchall()
+        for row in rows:
+            yield row[0]
+
+    def iterate_ads(self, after_ad_id=None):
+        # ids in ascending order, each batch of ids is read front to back through the segments
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT ad_id, segment, offset, length FROM ads WHERE ad_id > ? ORDER BY ad_id',
+                (after_ad_id if after_ad_id is not None else -1,),
+            ).fetchall()
+
+        files = {}
+        try:
+            for start in range(0, len(rows), self.READ_BATCH_SIZE):
+                batch = rows[start:start + self.READ_BATCH_SIZE]
+                htmls = {}
+                for ad_id, segment, offset, length in sorted(batch, key=lambda row: (row[1], row[2])):
+                    if segment not in files:
+                        files[segment] = open(self._get_segment_path(segment), 'rb')
+                    files[segment].seek(offset)
+                    htmls[ad_id] = self._decompress(files[segment].read(length), segment)
+                for row in batch:
+                    yield row[0], htmls[row[0]]
+        finally:
+            for file in files.values():
+                file.close()
+
+    def _add_sample(self, data):
+        # called with the lock held, trains once enough pages were seen
+        self._samples.append(data)
+        if len(self._samples) < self.DICTIONARY_SAMPLES:
+            return
+        samples, self._samples = self._samples, []
+        self._train(samples)
+
+    def _train(self, samples):
+        # called with the lock held, later pages go to a new segment that uses the new dictionary
+        try:
+            dictionary = zstandard.train_dictionary(self.DICTIONARY_SIZE, samples)
+        except zstandard.ZstdError as e:
+            logging.warning('training the segment dictionary failed: %s' % e)
+            return
+        cursor = self._connection.execute('INSERT INTO dictionaries (data) VALUES (?)', (dictionary.as_bytes(),))
+        self._dictionaries[cursor.lastrowid] = dictionary
+        self._dictionary_id = cursor.lastrowid
+        if self._segment in self._segment_dictionaries:
+            self._start_segment(self._segment + 1)
+        logging.info('trained segment dictionary %d on %d pages' % (self._dictionary_id, len(samples)))
+
+    def _start_segment(self, segment):
+        # called with the lock held, every page of a segment uses the dictionary it started with
+        self._segment = segment
+        self._segment_dictionaries[segment] = self._dictionary_id
+        self._connection.execute('INSERT OR REPLACE INTO segments (segment, dictionary_id) VALUES (?, ?)', (segment, self._dictionary_id))
+
+    def _get_compressor(self, dictionary_id):
+        compressors = self._local.__dict__.setdefault('compressors', {})
+        if dictionary_id not in compressors:
+            compressors[dictionary_id] = zstandard.ZstdCompressor(level=self.compression_level, dict_data=self._dictionaries.get(dictionary_id))
+        return compressors[dictionary_id]
+
+    def _decompress(self, blob, segment):
+        dictionary_id = self._segment_dictionaries.get(segment)
+        decompressors = self._local.__dict__.setdefault('decompressors', {})
+        if dictionary_id not in decompressors:
+            decompressors[dictionary_id] = zstandard.ZstdDecompressor(dict_data=self._dictionaries.get(dictionary_id))
+        return decompressors[dictionary_id].decompress(blob).decode('utf-8')
+
+    def _get_segment_path(self, segment):
+        return os.path.join(self.directory, 'segment-%06d.zst' % segment)
@@ -0,0 +1,68 @@
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+
+class PriceHistory(object):
+    # append-only observations per ad, one row per content version
+    path = None
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS observations ('
+            'ad_id INTEGER NOT NULL, observed_at TEXT NOT NULL, content_hash TEXT NOT NULL, price INTEGER, mileage INTEGER, '
+            'last_seen_at TEXT, '
+            'PRIMARY KEY (ad_id, observed_at)) WITHOUT ROWID'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS observations_by_time ON observations (observed_at)')
+        self._connection.commit()
+
+    def record(self, ad_id, content_hash, price, mileage):
+        # a new row if the stored content hash differs from the latest version, seeing it again only moves last_seen_at
+        now = str(datetime.now())
+        with self._lock:
+            latest = self._connection.execute(
+                'SELECT observed_at, content_hash FROM observations WHERE ad_id = ? ORDER BY observed_at DESC LIMIT 1', (ad_id,)
+            ).fetchone()
+            if latest is not None and latest[1] == content_hash:
+                self._connection.execute(
+                    'UPDATE observations SET last_seen_at = ? WHERE ad_id = ? AND observed_at = ?', (now, ad_id, latest[0])
+                )
+            else:
+                self._connection.execute(
+                    'INSERT INTO observations (ad_id, observed_at, content_hash, price, mileage, last_seen_at) VALUES (?, ?, ?, ?, ?, ?)',
+                    (ad_id, now, content_hash, price, mileage, now),
+                )
+            self._connection.commit()
+
+    def get(self, ad_id):
+        with self._lock:
+            return self._connection.execute(
+                'SELECT observed_at, price, mileage, last_seen_at FROM observations WHERE ad_id = ? ORDER BY observed_at', (ad_id,)
+            ).fetchall()
+
+    def price_drops(self, hours):
+        # (ad_id, observed_at, previous price, price) for drops observed in the last hours, biggest first
+        since = str(datetime.now() - timedelta(hours=hours))
+        with self._lock:
+            return self._connection.execute(
+                'WITH changes AS ('
+                '  SELECT ad_id, observed_at, price, LAG(price) OVER (PARTITION BY ad_id ORDER BY observed_at) AS previous_price'
+                '  FROM observations WHERE ad_id IN (SELECT ad_id FROM observations WHERE observed_at >= ?)'
+                ') '
+                'SELECT ad_id, observed_at, previous_price, price FROM changes '
+                'WHERE observed_at >= ? AND price < previous_price ORDER BY previous_price - price DESC',
+                (since, since),
+            ).fetchall()
+
+    def aggregate(self):
+        # one row per ad: observations, first and max price, latest price, first observation
+        with self._lock:
+            return self._connection.execute(
+                'SELECT o.ad_id, COUNT(*), MIN(o.observed_at), MAX(o.price), '
+                '  (SELECT price FROM observations l WHERE l.ad_id = o.ad_id ORDER BY l.observed_at DESC LIMIT 1) '
+                'FROM observations o GROUP BY o.ad_id'
+            ).fetchall()
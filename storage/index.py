@@ -0,0 +1,111 @@
+import bisect
+import logging
+import re
+import sqlite3
+import threading
+import time
+from array import array
+
+AD_KEY_PATTERN = re.compile(r'^mobile/ads/(\d+)/data\.html$')
+
+LIST_PREFIX = 'mobile/ads/'
+
+# ad ids have the same number of digits, so the key order is the id order
+AD_KEY = LIST_PREFIX + '%d/data.html'
+
+
+class StorageIndex(object):
+    # local manifest of stored ad ids: sorted array in memory, sqlite on disk
+    path = None
+    refresh_interval = None
+
+    def __init__(self, path, refresh_interval=60 * 60):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._ad_ids = array('q')
+        self._refreshed_at = None
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS ads (ad_id INTEGER PRIMARY KEY, saved_at REAL)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL)')
+        self._connection.commit()
+        self._load()
+
+    def __contains__(self, ad_id):
+        with self._lock:
+            index = bisect.bisect_left(self._ad_ids, ad_id)
+            return index < len(self._ad_ids) and self._ad_ids[index] == ad_id
+
+    def __iter__(self):
+        with self._lock:
+            ad_ids = array('q', self._ad_ids)
+        return iter(ad_ids)
+
+    def __len__(self):
+        return len(self._ad_ids)
+
+    def add(self, ad_id, saved_at=None):
+        with self._lock:
+            self._insert(ad_id)
+            self._connection.execute('INSERT OR REPLACE INTO ads (ad_id, saved_at) VALUES (?, ?)', (ad_id, saved_at if saved_at is not None else time.time()))
+            self._connection.commit()
+
+    def get_saved_at(self, ad_id):
+        # unix time the object was last written, None if unknown
+        with self._lock:
+            row = self._connection.execute('SELECT saved_at FROM ads WHERE ad_id = ?', (ad_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def remove(self, ad_id):
+        # listings only add ids, objects found missing are dropped here
+        with self._lock:
+            index = bisect.bisect_left(self._ad_ids, ad_id)
+            if index < len(self._ad_ids) and self._ad_ids[index] == ad_id:
+                del self._ad_ids[index]
+            self._connection.execute('DELETE FROM ads WHERE ad_id = ?', (ad_id,))
+            self._connection.commit()
+
+    def is_listed(self):
+        # False until the bucket was listed once
+        return self._refreshed_at is not None
+
+    def is_stale(self):
+        return self._refreshed_at is None or time.time() - self._refreshed_at > self.refresh_interval
+
+    def refresh(self, client, bucket_name):
+        # incremental listing of the keys after the highest indexed id, merged into the manifest
+        start = time.time()
+        parameters = {'Bucket': bucket_name, 'Prefix': LIST_PREFIX}
+        with self._lock:
+            if len(self._ad_ids) > 0:
+                parameters['StartAfter'] = AD_KEY % self._ad_ids[-1]
+        paginator = client.get_paginator('list_objects_v2')
+        new_ads = []  # (ad id, unix time it was last modified)
+        for page in paginator.paginate(**parameters):
+            for s3_object in page.get('Contents', []):
+                match = AD_KEY_PATTERN.match(s3_object['Key'])
+                if match is not None:
+                    ad_id = int(match.group(1))
+                    if ad_id not in self:
+                        new_ads.append((ad_id, s3_object['LastModified'].timestamp()))
+
+        with self._lock:
+            for ad_id, _ in new_ads:
+                self._insert(ad_id)
+            self._connection.executemany('INSERT OR IGNORE INTO ads (ad_id, saved_at) VALUES (?, ?)', new_ads)
+            self._connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', ('refreshed_at', start))
+            self._connection.commit()
+            self._refreshed_at = start
+
+        logging.info('storage index refreshed, %d new of %d ads' % (len(new_ads), len(self._ad_ids)))
+
+    def _load(self):
+        self._ad_ids = array('q', (row[0] for row in self._connection.execute('SELECT ad_id FROM ads ORDER BY ad_id')))
+        row = self._connection.execute("SELECT value FROM meta WHERE key = 'refreshed_at'").fetchone()
+        self._refreshed_at = row[0] if row is not None else None
+
+    def _insert(self, ad_id):
+        index = bisect.bisect_left(self._ad_ids, ad_id)
+        if index == len(self._ad_ids) or self._ad_ids[index] != ad_id:
+            self._ad_ids.insert(index, ad_id)
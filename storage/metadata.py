@@ -0,0 +1,89 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+COLUMNS = ['ad_id', 'content_hash', 'etag', 'last_modified', 'created_at', 'updated_at', 'last_seen_at', 'checked_at']
+
+
+class AdMetadata(object):
+    # per ad: content hash, http validators, crawler timestamps and the car extracted from the content
+    path = None
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS ads ('
+            'ad_id INTEGER PRIMARY KEY, content_hash TEXT, etag TEXT, last_modified TEXT, '
+            'created_at TEXT, updated_at TEXT, last_seen_at TEXT, checked_at TEXT)'
+        )
+        self._connection.execute('CREATE TABLE IF NOT EXISTS cars (ad_id INTEGER PRIMARY KEY, content_hash TEXT, car TEXT)')
+        self._connection.commit()
+
+    def get(self, ad_id):
+        with self._lock:
+            row = self._connection.execute('SELECT %s FROM ads WHERE ad_id = ?' % ', '.join(COLUMNS), (ad_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(COLUMNS, row))
+
+    def record(self, ad_id, content_hash, etag=None, last_modified=None):
+        # returns whether the content changed since the last record
+        now = str(datetime.now())
+        with self._lock:
+            row = self._connection.execute('SELECT content_hash FROM ads WHERE ad_id = ?', (ad_id,)).fetchone()
+            if row is None:
+                self._connection.execute(
+                    'INSERT INTO ads (%s) VALUES (?, ?, ?, ?, ?, ?, ?, ?)' % ', '.join(COLUMNS),
+                    (ad_id, content_hash, etag, last_modified, now, now, now, now),
+                )
+                changed = True
+            elif row[0] != content_hash:
+                self._connection.execute(
+                    'UPDATE ads SET content_hash = ?, etag = ?, last_modified = ?, updated_at = ?, last_seen_at = ?, checked_at = ? WHERE ad_id = ?',
+                    (content_hash, etag, last_modified, now, now, now, ad_id),
+                )
+                changed = True
+            else:
+                self._connection.execute(
+                    'UPDATE ads SET etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified), last_seen_at = ?, checked_at = ? WHERE ad_id = ?',
+                    (etag, last_modified, now, now, ad_id),
+                )
+                changed = False
+            self._connection.commit()
+        return changed
+
+    def touch(self, ad_id, checked=False):
+        # checked=True if the server confirmed the ad is unchanged, not just the storage
+        now = str(datetime.now())
+        with self._lock:
+            if checked:
+                self._connection.execute('UPDATE ads SET last_seen_at = ?, checked_at = ? WHERE ad_id = ?', (now, now, ad_id))
+            else:
+                self._connection.execute('UPDATE ads SET last_seen_at = ? WHERE ad_id = ?', (now, ad_id))
+            self._connection.commit()
+
+    def seed(self, ad_id, content_hash, saved_at):
+        # ad stored before it had metadata, no validators and timestamps from the time it was saved
+        # it counts as checked now, so it is served from storage until it is due like any other stored ad
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR IGNORE INTO ads (%s) VALUES (?, ?, NULL, NULL, ?, ?, ?, ?)' % ', '.join(COLUMNS),
+                (ad_id, content_hash, saved_at, saved_at, saved_at, str(datetime.now())),
+            )
+            self._connection.commit()
+
+    def get_car(self, ad_id, content_hash):
+        # car extracted from this content, None if it was not extracted yet
+        with self._lock:
+            row = self._connection.execute('SELECT content_hash, car FROM cars WHERE ad_id = ?', (ad_id,)).fetchone()
+        if row is None or row[0] != content_hash:
+            return None
+        return json.loads(row[1])
+
+    def put_car(self, ad_id, content_hash, car):
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO cars (ad_id, content_hash, car) VALUES (?, ?, ?)', (ad_id, content_hash, json.dumps(car)))
+            self._connection.commit()